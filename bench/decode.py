@@ -0,0 +1,53 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.mock_node import SyntheticChain, MockNode
+from utils import codec
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compare per block /commit and /validators decode CPU against the stdlib baseline')
+    parser.add_argument('--validators', type=int, default=150)
+    parser.add_argument('--blocks', type=int, default=2000)
+    return parser.parse_args()
+
+def stdlib_commit(data):
+    result = json.loads(data)['result']
+    signatures = [signature['validator_address'] for signature in result['signed_header']['commit']['signatures']]
+    header = result['signed_header']['header']
+    return {"signatures": signatures, "proposer": header['proposer_address'], "validators_hash": header.get('validators_hash')}
+
+def stdlib_valset(data):
+    return [validator['address'] for validator in json.loads(data)['result']['validators']]
+
+def measure(decode, bodies):
+    start_time = time.process_time()
+    for body in bodies:
+        decode(body)
+    return (time.process_time() - start_time) * 1e6 / len(bodies)
+
+def main():
+    args = parse_args()
+    chain = SyntheticChain(validators=args.validators, latest_height=args.blocks + 1)
+    node = MockNode(chain)
+
+    commits = [json.dumps({'jsonrpc': '2.0', 'id': -1, 'result': node.commit_result(height)}).encode() for height in range(1, args.blocks + 1)]
+    valsets = [json.dumps({'jsonrpc': '2.0', 'id': -1, 'result': node.validators_result(height, 1, 100)}).encode() for height in range(1, args.blocks + 1, 10)]
+
+    for body in commits[:10]:
+        assert set(codec.decode_commit(body)['signatures']) == set(stdlib_commit(body)['signatures']) - {''}
+
+    print(f"{args.validators} validators, {len(commits[0])} byte /commit, {len(valsets[0])} byte /validators page")
+    baseline = measure(stdlib_commit, commits)
+    lean = measure(codec.decode_commit, commits)
+    print(f"/commit     json: {baseline:.1f} us/block, {codec.BACKEND}: {lean:.1f} us/block ({baseline / lean:.1f}x)")
+    baseline = measure(stdlib_valset, valsets)
+    lean = measure(codec.decode_valset, valsets)
+    print(f"/validators json: {baseline:.1f} us/page, {codec.BACKEND}: {lean:.1f} us/page ({baseline / lean:.1f}x)")
+
+if __name__ == "__main__":
+    main()
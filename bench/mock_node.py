@@ -0,0 +1,261 @@
+import asyncio
+import base64
+import random
+import re
+import time
+from hashlib import sha256
+from aiohttp import web
+import bech32
+
+class SyntheticChain:
+
+    def __init__(self, validators=150, latest_height=10000, lowest_height=1, churn=500, miss_rate=0.1, joins=0, slash_rate=0.0, prefix='mock', seed=1):
+        self.latest_height = latest_height
+        self.lowest_height = lowest_height
+        self.churn = churn
+        self.miss_rate = miss_rate
+        self.prefix = prefix
+
+        rng = random.Random(seed)
+        self.validators = []
+        for index in range(validators):
+            pubkey = rng.randbytes(32)
+            operator = sha256(pubkey).digest()[12:]
+            self.validators.append({
+                'moniker': f"validator-{index}",
+                'pubkey': base64.b64encode(pubkey).decode(),
+                'hex': sha256(pubkey).digest()[:20].hex().upper(),
+                'valoper': bech32.bech32_encode(f"{prefix}valoper", bech32.convertbits(operator, 8, 5)),
+                'valcons': bech32.bech32_encode(f"{prefix}valcons", bech32.convertbits(sha256(pubkey).digest()[:20], 8, 5)),
+                'join_height': 0
+            })
+
+        # The last validators are created during the run, spread evenly over the indexed range
+        joins = min(joins, validators - 1)
+        for index in range(joins):
+            self.validators[validators - joins + index]['join_height'] = lowest_height + (index + 1) * (latest_height - lowest_height) // (joins + 1)
+
+        # Seeded apart from the keys so the validator set does not depend on the slash rate
+        rng = random.Random(f"slash-{seed}")
+        self.slashes = {}
+        for validator in self.validators:
+            if rng.random() < slash_rate:
+                first_height = max(validator['join_height'], lowest_height)
+                self.slashes[validator['valcons']] = sorted(rng.sample(range(first_height, latest_height + 1), min(3, latest_height + 1 - first_height)))
+
+    def epoch(self, height):
+        return height // self.churn if self.churn else 0
+
+    def active(self, height):
+        # Every churn epoch one validator sits out, so the set and its hash change
+        inactive = self.epoch(height) % len(self.validators) if self.churn else None
+        return [validator for index, validator in enumerate(self.validators) if index != inactive and validator['join_height'] <= height]
+
+    def validators_hash(self, height):
+        joined = sum(validator['join_height'] <= height for validator in self.validators)
+        return sha256(f"valset-{self.epoch(height)}-{joined}".encode()).hexdigest().upper()
+
+    def signed(self, height, validator):
+        return sha256(f"{height}{validator['hex']}".encode()).digest()[0] >= self.miss_rate * 256
+
+    def proposer(self, height):
+        active = self.active(height)
+        return active[height % len(active)]
+
+    def slash_heights(self, valcons, min_height=None, max_height=None):
+        return [height for height in self.slashes.get(valcons, []) if (min_height is None or height > min_height) and (max_height is None or height <= max_height)]
+
+    def expected_counters(self, start_height, end_height):
+        counters = {validator['hex']: [0, 0, 0] for validator in self.validators}
+        for height in range(start_height, end_height):
+            proposer = self.proposer(height)
+            for validator in self.active(height):
+                counters[validator['hex']][0 if self.signed(height, validator) else 1] += 1
+            counters[proposer['hex']][2] += 1
+        return counters
+
+class MockNode:
+
+    def __init__(self, chain, latency=0.0, error_rate=0.0, seed=1):
+        self.chain = chain
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.requests = {}
+        self.durations = []
+        # Validators only exist on the staking API once the indexer has asked about a height after they joined
+        self.served_height = 0
+
+        self.app = web.Application(middlewares=[self.middleware])
+        self.app.router.add_post('/', self.batch)
+        self.app.router.add_get('/abci_info', self.abci_info)
+        self.app.router.add_get('/block', self.block)
+        self.app.router.add_get('/commit', self.commit)
+        self.app.router.add_get('/validators', self.validators)
+        self.app.router.add_get('/block_search', self.block_search)
+        self.app.router.add_get('/cosmos/base/tendermint/v1beta1/node_info', self.node_info)
+        self.app.router.add_get('/cosmos/staking/v1beta1/validators', self.staking_validators)
+        self.app.router.add_get('/cosmos/staking/v1beta1/validators/{valoper}/delegations', self.delegations)
+        self.app.router.add_get('/cosmos/slashing/v1beta1/signing_infos/{valcons}', self.signing_info)
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        start_time = time.perf_counter()
+        # Counted per route so per validator lookups share one entry
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        self.requests[route] = self.requests.get(route, 0) + 1
+        try:
+            if self.latency:
+                await asyncio.sleep(self.rng.expovariate(1 / self.latency))
+            if self.error_rate and self.rng.random() < self.error_rate:
+                return web.Response(status=503)
+            return await handler(request)
+        finally:
+            self.durations.append(time.perf_counter() - start_time)
+
+    def reset_stats(self):
+        self.requests = {}
+        self.durations = []
+        self.served_height = 0
+
+    def commit_result(self, height):
+        self.served_height = max(self.served_height, height)
+        chain = self.chain
+        signatures = []
+        for validator in chain.active(height):
+            signed = chain.signed(height, validator)
+            signatures.append({
+                'block_id_flag': 2 if signed else 1,
+                'validator_address': validator['hex'] if signed else '',
+                'timestamp': '2024-01-01T00:00:00.000000000Z',
+                'signature': base64.b64encode(sha256(f"{height}{validator['hex']}".encode()).digest() * 2).decode() if signed else None
+            })
+        header = {
+            'chain_id': 'mock-1',
+            'height': str(height),
+            'time': '2024-01-01T00:00:00.000000000Z',
+            'validators_hash': chain.validators_hash(height),
+            'next_validators_hash': chain.validators_hash(height + 1),
+            'proposer_address': chain.proposer(height)['hex']
+        }
+        return {'signed_header': {'header': header, 'commit': {'height': str(height), 'round': 0, 'signatures': signatures}}, 'canonical': True}
+
+    def validators_result(self, height, page, per_page):
+        self.served_height = max(self.served_height, height)
+        active = self.chain.active(height)
+        chunk = active[(page - 1) * per_page:page * per_page]
+        validators = [{'address': validator['hex'], 'pub_key': {'type': 'tendermint/PubKeyEd25519', 'value': validator['pubkey']}, 'voting_power': '1000', 'proposer_priority': '0'} for validator in chunk]
+        return {'block_height': str(height), 'validators': validators, 'count': str(len(chunk)), 'total': str(len(active))}
+
+    def rpc_error(self, height):
+        return {'code': -32603, 'message': 'Internal error', 'data': f"height {height} is not available, lowest height is {self.chain.lowest_height}"}
+
+    def page_error(self, height, page, per_page):
+        # Like CometBFT, a page past the end of the set is an error rather than an empty list
+        pages = max(1, -(-len(self.chain.active(height)) // per_page))
+        if 1 <= page <= pages:
+            return None
+        return {'code': -32603, 'message': 'Internal error', 'data': f"page should be within [1, {pages}] range, given {page}"}
+
+    async def batch(self, request):
+        results = []
+        for call in await request.json():
+            height = int(call['params']['height'])
+            response = {'jsonrpc': '2.0', 'id': call['id']}
+            if height < self.chain.lowest_height:
+                response['error'] = self.rpc_error(height)
+            elif call['method'] == 'commit':
+                response['result'] = self.commit_result(height)
+            elif call['method'] == 'validators':
+                page, per_page = int(call['params'].get('page', 1)), int(call['params'].get('per_page', 30))
+                error = self.page_error(height, page, per_page)
+                if error is not None:
+                    response['error'] = error
+                else:
+                    response['result'] = self.validators_result(height, page, per_page)
+            else:
+                response['error'] = {'code': -32601, 'message': 'Method not found'}
+            results.append(response)
+        return web.json_response(results)
+
+    async def abci_info(self, request):
+        return web.json_response({'result': {'response': {'last_block_height': str(self.chain.latest_height)}}})
+
+    async def block(self, request):
+        height = int(request.query['height'])
+        if height < self.chain.lowest_height:
+            return web.json_response({'error': self.rpc_error(height)}, status=500)
+        return web.json_response({'result': {'block': {'header': {'height': str(height)}}}})
+
+    async def commit(self, request):
+        height = int(request.query['height'])
+        if height < self.chain.lowest_height:
+            return web.json_response({'error': self.rpc_error(height)}, status=500)
+        return web.json_response({'jsonrpc': '2.0', 'id': -1, 'result': self.commit_result(height)})
+
+    async def validators(self, request):
+        height = int(request.query['height'])
+        if height < self.chain.lowest_height:
+            return web.json_response({'error': self.rpc_error(height)}, status=500)
+        page, per_page = int(request.query.get('page', 1)), int(request.query.get('per_page', 30))
+        error = self.page_error(height, page, per_page)
+        if error is not None:
+            return web.json_response({'jsonrpc': '2.0', 'id': -1, 'error': error}, status=500)
+        result = self.validators_result(height, page, per_page)
+        return web.json_response({'jsonrpc': '2.0', 'id': -1, 'result': result})
+
+    async def block_search(self, request):
+        # Only the slash.address and block.height conditions sent by the indexer are understood
+        query = request.query.get('query', '').strip('"')
+        address = re.search(r"slash\.address='([^']*)'", query)
+        min_height = re.search(r"block\.height>(\d+)", query)
+        max_height = re.search(r"block\.height<=(\d+)", query)
+        heights = self.chain.slash_heights(
+            address.group(1) if address else None,
+            min_height=int(min_height.group(1)) if min_height else None,
+            max_height=min(int(max_height.group(1)), self.chain.latest_height) if max_height else self.chain.latest_height
+        )
+        if request.query.get('order_by', '').strip('"') == 'desc':
+            heights.reverse()
+
+        page, per_page = int(request.query.get('page', 1)), min(int(request.query.get('per_page', 30)), 100)
+        pages = max(1, -(-len(heights) // per_page))
+        if not 1 <= page <= pages:
+            error = {'code': -32603, 'message': 'Internal error', 'data': f"page should be within [1, {pages}] range, given {page}"}
+            return web.json_response({'jsonrpc': '2.0', 'id': -1, 'error': error}, status=500)
+
+        blocks = [{'block': {'header': {'height': str(height), 'time': '2024-01-01T00:00:00.000000000Z'}}} for height in heights[(page - 1) * per_page:page * per_page]]
+        return web.json_response({'jsonrpc': '2.0', 'id': -1, 'result': {'blocks': blocks, 'total_count': str(len(heights))}})
+
+    async def node_info(self, request):
+        return web.json_response({'default_node_info': {'network': 'mock-1'}})
+
+    async def staking_validators(self, request):
+        validators = []
+        for validator in self.chain.validators:
+            if validator['join_height'] > self.served_height:
+                continue
+            validators.append({
+                'operator_address': validator['valoper'],
+                'consensus_pubkey': {'@type': '/cosmos.crypto.ed25519.PubKey', 'key': validator['pubkey']},
+                'description': {'moniker': validator['moniker']},
+                'commission': {'commission_rates': {'rate': '0.050000000000000000'}}
+            })
+        return web.json_response({'validators': validators, 'pagination': {'next_key': None, 'total': str(len(validators))}})
+
+    async def delegations(self, request):
+        return web.json_response({'delegation_responses': [], 'pagination': {'total': '42'}})
+
+    async def signing_info(self, request):
+        return web.json_response({'val_signing_info': {'address': request.match_info['valcons'], 'tombstoned': False}})
+
+    async def start(self, host='127.0.0.1', port=0):
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{self.port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
@@ -0,0 +1,148 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from yaml import safe_dump
+
+BENCH_PATH = os.path.dirname(os.path.abspath(__file__))
+ROOT_PATH = os.path.dirname(BENCH_PATH)
+sys.path.insert(0, ROOT_PATH)
+
+from bench.mock_node import SyntheticChain, MockNode
+from utils.checkpoint import CheckpointStore
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run main.py against a local mock node and report indexing throughput')
+    parser.add_argument('--validators', type=int, default=150)
+    parser.add_argument('--heights', type=int, default=5000, help='number of blocks to index')
+    parser.add_argument('--churn', type=int, default=500, help='heights between validator set changes, 0 for a static set')
+    parser.add_argument('--miss-rate', type=float, default=0.1)
+    parser.add_argument('--max-validators', type=int, help='max_number_of_valdiators_ever_in_the_active_set, left to the indexer default when not set')
+    parser.add_argument('--joins', type=int, default=0, help='validators created while the run is in progress')
+    parser.add_argument('--slash-rate', type=float, default=0.0, help='share of validators with slash events')
+    parser.add_argument('--latency', type=float, default=0.0, help='mean injected response latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with 503')
+    parser.add_argument('--batch-size', type=int, default=150)
+    parser.add_argument('--rpc-batch-size', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=1, help='backfill worker processes')
+    parser.add_argument('--archive', action='store_true', help='also write the signing archive')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', dest='json_path', help='write the results to this file')
+    return parser.parse_args()
+
+def write_config(path, url, args, start_height):
+    config = {
+        'rpc': url,
+        'api': url,
+        'bech_32_prefix': 'mock',
+        'batch_size': args.batch_size,
+        'rpc_batch_size': args.rpc_batch_size,
+        'start_height': start_height,
+        'log_lvl': 'INFO',
+        'follow': False,
+        'metrics': {'jails': True, 'delegators': True, 'tombstones': True},
+        'archive': {'enabled': args.archive, 'path': 'archive'},
+        'backfill': {'workers': args.workers}
+    }
+    if args.max_validators is not None:
+        config['max_number_of_valdiators_ever_in_the_active_set'] = args.max_validators
+    with open(os.path.join(path, 'config.yaml'), 'w') as file:
+        safe_dump(config, file)
+
+def verify(path, chain, start_height):
+    metrics_data = CheckpointStore(logger=logging.getLogger('bench'), path=os.path.join(path, 'metrics.json')).load()
+    expected = chain.expected_counters(start_height, metrics_data['latest_height'])
+    if len(metrics_data['validators']) != len(chain.validators):
+        return False
+    for validator in metrics_data['validators']:
+        counters = [validator['total_signed_blocks'], validator['total_missed_blocks'], validator['total_proposed_blocks']]
+        if counters != expected.get(validator['hex'], [0, 0, 0]):
+            return False
+        # The slashing lookup only runs with metrics.jails, which the bench always enables
+        slashes = [int(slash['height']) for slash in validator.get('slashing_info') or []]
+        if slashes != chain.slash_heights(validator.get('valcons')):
+            return False
+    return metrics_data['latest_height'] == chain.latest_height
+
+def percentile(values, share):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+async def run_once(node, url, chain, args, start_height):
+    node.reset_stats()
+    with tempfile.TemporaryDirectory(prefix='bench_') as path:
+        write_config(path, url, args, start_height)
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start_time = time.perf_counter()
+
+        with open(os.path.join(path, 'output.log'), 'w') as output:
+            process = await asyncio.create_subprocess_exec(sys.executable, os.path.join(ROOT_PATH, 'main.py'), cwd=path, stdout=output, stderr=asyncio.subprocess.STDOUT)
+            await process.wait()
+
+        elapsed = time.perf_counter() - start_time
+        # Children are only accounted once reaped, backfill workers are reaped by main.py before it exits
+        usage_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = (usage_after.ru_utime - usage.ru_utime) + (usage_after.ru_stime - usage.ru_stime)
+
+        if process.returncode != 0:
+            with open(os.path.join(path, 'output.log'), 'r') as output:
+                print(output.read()[-2000:], file=sys.stderr)
+            raise SystemExit(f"main.py exited with {process.returncode}")
+
+        blocks = chain.latest_height - start_height
+        return {
+            'seconds': elapsed,
+            'blocks_per_second': blocks / elapsed,
+            'requests_per_block': sum(node.requests.values()) / blocks,
+            'latency_p50_ms': percentile(node.durations, 0.5) * 1000,
+            'latency_p99_ms': percentile(node.durations, 0.99) * 1000,
+            'cpu_ms_per_block': cpu * 1000 / blocks,
+            # ru_maxrss is the largest child so far in KiB, not a per run delta
+            'peak_rss_mb': usage_after.ru_maxrss / 1024,
+            'requests': dict(node.requests),
+            'verified': verify(path, chain, start_height)
+        }
+
+async def main():
+    args = parse_args()
+    start_height = 1
+    chain = SyntheticChain(validators=args.validators, latest_height=start_height + args.heights, churn=args.churn, miss_rate=args.miss_rate, joins=args.joins, slash_rate=args.slash_rate, seed=args.seed)
+    node = MockNode(chain, latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+    url = await node.start()
+
+    runs = []
+    try:
+        for run in range(1, args.repeat + 1):
+            result = await run_once(node, url, chain, args, start_height)
+            runs.append(result)
+            print(f"run {run}: {result['blocks_per_second']:.1f} blocks/s, {result['requests_per_block']:.2f} requests/block, "
+                  f"p50 {result['latency_p50_ms']:.1f} ms, p99 {result['latency_p99_ms']:.1f} ms, "
+                  f"{result['cpu_ms_per_block']:.2f} ms CPU/block, {result['peak_rss_mb']:.0f} MB peak RSS, "
+                  f"counters {'match' if result['verified'] else 'DO NOT MATCH'}")
+    finally:
+        await node.stop()
+
+    summary = {key: statistics.median(run[key] for run in runs) for key in ('seconds', 'blocks_per_second', 'requests_per_block', 'latency_p50_ms', 'latency_p99_ms', 'cpu_ms_per_block', 'peak_rss_mb')}
+    summary['verified'] = all(run['verified'] for run in runs)
+    print(f"median: {summary['blocks_per_second']:.1f} blocks/s, {summary['requests_per_block']:.2f} requests/block, "
+          f"p50 {summary['latency_p50_ms']:.1f} ms, p99 {summary['latency_p99_ms']:.1f} ms, "
+          f"{summary['cpu_ms_per_block']:.2f} ms CPU/block, {summary['peak_rss_mb']:.0f} MB peak RSS")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as file:
+            json.dump({'parameters': vars(args), 'summary': summary, 'runs': runs}, file, indent=2)
+
+    if not summary['verified']:
+        exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,90 +1,93 @@
 import asyncio
 import json
+import multiprocessing
 import os
+import shutil
+import time
 from sys import exit
+import aiohttp
 from tqdm import tqdm
 from yaml import safe_load
 from utils.logger import setup_logger
 from utils.aio_calls import AioHttpCalls
-from utils.decoder import Decoder
+from utils.tally import Tally
+from utils.windows import SigningWindows, WINDOW_FIELDS, merge_windows
+from utils.gaps import GapScheduler
+from utils.pipeline import fetch_ordered
+from utils.checkpoint import CheckpointStore
+from utils.archive import SigningArchive
+from utils.concurrency import jittered_backoff
+from utils.metrics import MetricsServer
+from utils.registry import ValidatorRegistry, describe_validator
+from utils.chains import Chain, chain_configs
 
 with open('config.yaml', 'r') as config_file:
     config = safe_load(config_file)
 
 logger = setup_logger(log_level=config['log_lvl'])
 
-decoder = Decoder(bech32_prefix=config['bech_32_prefix'], logger=logger)
-
-async def get_validators(session):
+async def get_validators(chain, session):
     validators = await session.get_validators(status=None)
     if validators:
         for index, validator  in enumerate(validators, start=1):
-            validator['wallet'] = decoder.convert_valoper_to_account(valoper=validator['valoper'])
-            validator['valcons'] = decoder.convert_consenses_pubkey_to_valcons(consensus_pub_key=validator['consensus_pubkey'])
-            validator['hex'] = decoder.conver_valcons_to_hex(valcons=validator['valcons'])
-            validator['total_signed_blocks'] = 0
-            validator['total_missed_blocks'] = 0
-            validator['total_proposed_blocks'] = 0
-            validator['index'] = index
+            describe_validator(validator, chain.decoder, index)
         return validators
 
 
-async def get_slashing_info(validators, session, total_vals, batch_size=10):
-    all_validators = []
-    
-    for i in range(0, len(validators), batch_size):
-        batch = validators[i:i + batch_size]
-        batch_tasks = []
-        for validator in batch:
-            batch_tasks.append(session.get_slashing_info_archive(validator['valcons']))
-        
-        batch_results = await asyncio.gather(*batch_tasks)
-
-        for validator, slashing_info in zip(batch, batch_results):
-            validator['slashing_info'] = slashing_info
-            logger.info(f"Fetched slashing info for {validator['valoper'].ljust(3)} | {validator['index']} / {total_vals}")
-        
-        all_validators.extend(batch)
-    
-    return all_validators
-
-async def get_delegators_number(validators, session, total_vals, batch_size=10):
-    all_validators = []
-    
-    for i in range(0, len(validators), batch_size):
-        batch = validators[i:i + batch_size]
-        batch_tasks = []
-        for validator in batch:
-            batch_tasks.append(session.get_total_delegators(validator['valoper']))
-        
-        batch_results = await asyncio.gather(*batch_tasks)
-
-        for validator, slashing_info in zip(batch, batch_results):
-            validator['delegators_count'] = slashing_info
-            logger.info(f"Fetched delegators info for {validator['valoper'].ljust(3)} | {validator['index']} / {total_vals}")
-        
-        all_validators.extend(batch)
-    
-    return all_validators
-
-async def check_valdiator_tomb(validators, session, total_vals, batch_size=10):
-    all_validators = []
-
-    for i in range(0, len(validators), batch_size):
-        batch = validators[i:i + batch_size]
-        batch_tasks = []
-        for validator in batch:
-            batch_tasks.append(session.get_validator_tomb(validator['valcons']))
-        
-        batch_results = await asyncio.gather(*batch_tasks)
-
-        for validator, slashing_info in zip(batch, batch_results):
-            validator['tombstoned'] = slashing_info
-            logger.info(f"Fetched double sign info for {validator['valoper'].ljust(3)} | {validator['index']} / {total_vals}")
-        
-        all_validators.extend(batch)
-    
-    return all_validators
+async def update_slashing_info(validator, session, latest_height):
+    # Without the head height the scan has no upper bound to resume from, the lookup waits for the next run
+    if not latest_height:
+        return validator.get('slashing_info')
+
+    scanned_height = validator.get('slashing_scanned_height')
+    slashes = await session.get_slashing_info_archive(validator['valcons'], min_height=scanned_height, max_height=latest_height)
+    if slashes is None:
+        return validator.get('slashing_info')
+
+    validator['slashing_scanned_height'] = latest_height
+    # A record that was never scanned up to a height is replaced, the full scan already returns everything it holds
+    previous = (validator.get('slashing_info') or []) if scanned_height is not None else []
+    slashing_info = previous + slashes
+    return slashing_info or None
+
+async def fetch_validator_metadata(chain, validators, session):
+    config, logger = chain.config, chain.logger
+    lookups = []
+    if config['metrics']['jails']:
+        # Slashing history is refreshed on every run, only above the height scanned last time
+        latest_height = await session.get_latest_block_height_rpc()
+        lookups.append(('slashing_info', 'slashing', True, lambda validator: update_slashing_info(validator, session, latest_height)))
+    if config['metrics']['delegators']:
+        lookups.append(('delegators_count', 'delegators', False, lambda validator: session.get_total_delegators(validator['valoper'])))
+    if config['metrics'].get('tombstones'):
+        lookups.append(('tombstoned', 'double sign', False, lambda validator: session.get_validator_tomb(validator['valcons'])))
+
+    # One budget for every lookup kind, on top of the per-endpoint limit shared with block indexing
+    semaphore = asyncio.Semaphore(config.get('metadata_concurrency', 20))
+    total_vals = len(validators)
+
+    async def fetch(validator, field, name, incremental, lookup):
+        async with semaphore:
+            value = await lookup(validator)
+        # A failed one-off lookup leaves the field unset so the next run asks again, incremental ones keep their scanned height
+        if value is None and not incremental:
+            logger.debug(f"Failed to fetch {name} info for {validator['valoper']}")
+            return
+        validator[field] = value
+        logger.debug(f"Fetched {name} info for {validator['valoper'].ljust(3)} | {validator['index']} / {total_vals}")
+
+    tasks = []
+    for validator in validators:
+        for field, name, incremental, lookup in lookups:
+            if incremental or validator.get(field) is None:
+                tasks.append(fetch(validator, field, name, incremental, lookup))
+
+    if tasks:
+        logger.info(f"Fetching {len(tasks)} validator metadata lookups alongside block indexing")
+        await asyncio.gather(*tasks)
+        logger.info("Validator metadata fetched")
+
+    return len(tasks)
 
 
 
@@ -103,107 +106,462 @@ async def check_valdiator_tomb(validators, session, total_vals, batch_size=10):
     # return validators
 
 async def get_all_valset(session, height, max_vals):
-    valset_tasks = []
-    if max_vals <= 100:
-        page_max = 1
-    elif 100 < max_vals <= 200:
-        page_max = 2
-    elif 200 < max_vals <= 300:
-        page_max = 3
-    else:
-        page_max = 4
+    # The node answers pages past the end of the set with an error, page 1 tells how many there are
+    first_page = await session.get_valset_at_block_hex(height=height, page=1)
+    if first_page is None:
+        return None
 
-    for page in range(1, page_max + 1):
+    merged_valsets, total = first_page
+    if total is None:
+        total = max_vals if len(merged_valsets) == 100 else len(merged_valsets)
+    page_max = (total + 99) // 100
+
+    valset_tasks = []
+    for page in range(2, page_max + 1):
         valset_tasks.append(session.get_valset_at_block_hex(height=height, page=page))
     valset = await asyncio.gather(*valset_tasks)
-    
-    merged_valsets = []
 
-    for sublist in valset:
-        if sublist is not None:
-            for itm in  sublist:
-                merged_valsets.append(itm)
-
-    return merged_valsets
-
-async def parse_signatures_batches(validators, session, start_height, batch_size=300):
-
-    rpc_latest_height = await session.get_latest_block_height_rpc()
+    merged_valsets = list(merged_valsets)
+    for page_data in valset:
+        if page_data is None:
+            return None
+        merged_valsets.extend(page_data[0])
+
+    return frozenset(merged_valsets)
+
+async def get_registered_valset(session, height, max_vals, registry):
+    valset = await get_all_valset(session=session, height=height, max_vals=max_vals)
+    # Runs once per new set, so validators that joined are known before the first block they sign is tallied
+    if valset is not None:
+        await registry.resolve(valset, height)
+    return valset
+
+async def get_block_with_valset(session, height, max_vals, registry):
+    block = await session.get_block(height=height)
+    if block is None:
+        return None, None
+
+    valset = await session.valset_cache.get(
+        block['validators_hash'],
+        lambda: get_registered_valset(session=session, height=height, max_vals=max_vals, registry=registry)
+    )
+    return block, valset
+
+def open_registry(chain, validators, session):
+    return ValidatorRegistry(validators=validators, session=session, decoder=chain.decoder, logger=chain.logger, retry_interval=chain.config.get('registry_retry_interval', 600))
+
+def open_tally(chain, validators, leading=False):
+    windows_config = chain.config.get('windows') or {}
+    if not windows_config.get('enabled'):
+        return Tally(validators)
+
+    return Tally(validators, windows=SigningWindows(
+        validators=validators,
+        window=windows_config.get('signed_blocks_window', 10000),
+        proposals_window=windows_config.get('proposals_window', 1000),
+        leading=leading
+    ))
+
+def open_gap_scheduler(chain, store, fetch):
+    gaps_config = chain.config.get('gaps') or {}
+    return GapScheduler(
+        ledger=store.gaps,
+        fetch=fetch,
+        logger=chain.logger,
+        max_attempts=gaps_config.get('max_attempts', 8),
+        concurrency=gaps_config.get('retry_concurrency', 4)
+    )
+
+def add_late_blocks(scheduler, tally, archive):
+    # Counted in the totals only, the rolling windows have already moved past these heights
+    late_blocks = scheduler.take()
+    for block, valset in late_blocks:
+        tally.add_block(block, valset, windows=False)
+        if archive is not None:
+            archive.add_block(block, valset)
+    return late_blocks
+
+def open_archive(chain):
+    archive_config = chain.config.get('archive') or {}
+    if not archive_config.get('enabled'):
+        return None
+
+    return SigningArchive(
+        logger=chain.logger,
+        path=archive_config.get('path', 'archive'),
+        capacity=archive_config.get('capacity', 1024)
+    )
+
+async def parse_signatures_batches(chain, validators, session, start_height, batch_size=300, end_height=None, store=None, shard=None, scheduler=None, registry=None):
+    config, logger, metrics = chain.config, chain.logger, chain.metrics
+
+    rpc_latest_height = end_height or await session.get_latest_block_height_rpc()
     if not rpc_latest_height:
         logger.error("Failed to fetch RPC latest height. RPC is not reachable. Exiting.")
         exit(1)
 
-    with tqdm(total=rpc_latest_height, desc="Parsing Blocks", unit="block", initial=start_height) as pbar:
-
-        for start_height in range(start_height, rpc_latest_height, batch_size):
-            end_height = min(start_height + batch_size, rpc_latest_height)
-            max_vals = config.get('max_number_of_valdiators_ever_in_the_active_set') or 125
-
-            blocks_tasks = []
-            valset_tasks = []
-            
-            for current_height in range(start_height, end_height):
-                blocks_tasks.append(session.get_block(height=current_height))
-                valset_tasks.append(get_all_valset(session=session, height=current_height, max_vals=max_vals))
-
-            blocks, valsets = await asyncio.gather(
-                asyncio.gather(*blocks_tasks),
-                asyncio.gather(*valset_tasks),
-            )
-
-            for block, valset in zip(blocks, valsets):
-                if block is None or valset is None:
-                    logger.error("Failed to fetch block/valset info. Try to reduce batch size in config and restart. Exiting")
+    store = store or chain.checkpoints
+    tally = open_tally(chain=chain, validators=validators, leading=shard is not None)
+    registry = registry or open_registry(chain=chain, validators=validators, session=session)
+    # Backfill workers share the archive and assign slots to validators that join under its lock
+    archive = open_archive(chain=chain)
+    max_vals = config.get('max_number_of_valdiators_ever_in_the_active_set') or 125
+    max_failures = (config.get('gaps') or {}).get('max_consecutive_failures', 100)
+    checkpoint_height = start_height
+    checkpoint_time = time.perf_counter()
+    tally_cpu = 0
+    failures = 0
+    metrics.validators = validators
+    metrics.progress(indexed_height=start_height, head_height=rpc_latest_height)
+
+    fetch = lambda height: get_block_with_valset(session=session, height=height, max_vals=max_vals, registry=registry)
+    # The follow loop passes its own scheduler, which keeps retrying in the background after this pass
+    own_scheduler = scheduler is None
+    if own_scheduler:
+        scheduler = open_gap_scheduler(chain=chain, store=store, fetch=fetch)
+        scheduler.schedule_ledger()
+
+    blocks = fetch_ordered(
+        fetch,
+        start_height=start_height,
+        end_height=rpc_latest_height,
+        window=max(batch_size, 1)
+    )
+
+    description = chain.name or "Parsing Blocks"
+    if shard is not None:
+        description = f"{chain.name} shard {shard['index']}" if chain.name else f"Shard {shard['index']}"
+    position = chain.index if shard is None else shard['index']
+    initial = start_height if shard is None else start_height - shard['start_height']
+    total = rpc_latest_height if shard is None else shard['end_height'] - shard['start_height']
+
+    with tqdm(total=total, desc=description, unit="block", initial=initial, position=position) as pbar:
+
+        async for height, (block, valset) in blocks:
+            if block is None or valset is None:
+                # The height is retried in the background while indexing moves on
+                logger.debug(f"Failed to fetch block/valset info at height {height} after {session.max_retries} retries, scheduling it for a retry")
+                store.gaps.add(height)
+                scheduler.schedule(height)
+                failures += 1
+                if failures >= max_failures:
+                    scheduler.cancel()
+                    await blocks.aclose()
+                    add_late_blocks(scheduler=scheduler, tally=tally, archive=archive)
+                    tally.flush()
+                    if archive is not None:
+                        archive.close()
+                    await store.snapshot(latest_height=height + 1, validators=validators)
+                    logger.error(f"The last {failures} heights up to {height} all failed, the endpoints look down. Progress and missing ranges are saved, restart to continue. Exiting")
                     exit(1)
-
-                for validator in validators:
-                    if validator['hex'] in valset:
-                        if validator['hex'] == block['proposer']:
-                            validator['total_proposed_blocks'] += 1
-                        if validator['hex'] in block['signatures']:
-                            validator['total_signed_blocks'] += 1
-                        else:
-                            validator['total_missed_blocks'] += 1
-        
-            metrics_data = {
-                'latest_height': end_height,
-                'validators': validators
-            }
-            with open('metrics.json', 'w') as file:
-                json.dump(metrics_data, file)
+            else:
+                failures = 0
+                cpu_time = time.thread_time()
+                tally.add_block(block, valset)
+                tally_cpu += time.thread_time() - cpu_time
+                if archive is not None:
+                    archive.add_block(block, valset)
+
+            end_height = height + 1
+            if end_height - checkpoint_height < batch_size and end_height < rpc_latest_height:
+                continue
+
+            add_late_blocks(scheduler=scheduler, tally=tally, archive=archive)
+            cpu_time = time.thread_time()
+            deltas = tally.flush()
+            # Taken together with the deltas, a height recovered while the checkpoint is written belongs to the next one
+            missing = store.gaps.ranges()
+            metrics.tally_cpu.observe(tally_cpu + time.thread_time() - cpu_time)
+            tally_cpu = 0
+            if archive is not None:
+                await asyncio.to_thread(archive.flush)
+            if end_height == rpc_latest_height:
+                await store.snapshot(latest_height=end_height, validators=validators, missing=missing)
+            else:
+                await store.save(start_height=checkpoint_height, end_height=end_height, deltas=deltas, validators=validators, missing=missing)
             
             if config['log_lvl'] != 'DEBUG':
-                pbar.update(end_height - start_height)
+                pbar.update(end_height - checkpoint_height)
+            metrics.blocks.inc(end_height - checkpoint_height)
+            metrics.blocks_per_second.set(round((end_height - checkpoint_height) / (time.perf_counter() - checkpoint_time), 2))
+            metrics.progress(indexed_height=end_height)
+            metrics.missing_heights.set(len(store.gaps))
+            checkpoint_height = end_height
+            checkpoint_time = time.perf_counter()
+
+    following = own_scheduler and shard is None and config.get('follow')
+    if own_scheduler:
+        if following:
+            # The follow loop starts right away and retries what is left of the ledger in the background
+            scheduler.cancel()
+        else:
+            await scheduler.drain()
+
+        if add_late_blocks(scheduler=scheduler, tally=tally, archive=archive):
+            tally.flush()
+            missing = store.gaps.ranges()
+            if archive is not None:
+                await asyncio.to_thread(archive.flush)
+            await store.snapshot(latest_height=max(start_height, rpc_latest_height), validators=validators, missing=missing)
+            metrics.missing_heights.set(len(store.gaps))
+
+    if archive is not None:
+        archive.close()
+
+    if store.gaps and own_scheduler and not following:
+        logger.warning(f"Heights {store.gaps.describe()} are still missing from the counters, they are retried on the next run")
+
+    return max(start_height, rpc_latest_height)
+
+def zeroed_validators(validators):
+    return [{**validator, 'total_signed_blocks': 0, 'total_missed_blocks': 0, 'total_proposed_blocks': 0} for validator in validators]
+
+def plan_backfill(chain, validators, start_height, end_height, workers):
+    step = max((end_height - start_height) // workers, 1)
+    # Shard borders sit on multiples of 8 so workers never write to the same archive byte
+    borders = [start_height]
+    for worker in range(1, workers):
+        border = (start_height + worker * step) // 8 * 8
+        if borders[-1] < border < end_height:
+            borders.append(border)
+    borders.append(end_height)
+
+    shards = []
+    for index, (shard_start, shard_end) in enumerate(zip(borders, borders[1:])):
+        shards.append({
+            'index': index,
+            'start_height': shard_start,
+            'end_height': shard_end,
+            'path': os.path.join(chain.shards_path, f"shard_{index:03d}.json")
+        })
+
+    return {'start_height': start_height, 'end_height': end_height, 'validators': zeroed_validators(validators), 'shards': shards}
+
+def run_shard(chain_config, chain_index, shard, validators):
+    try:
+        chain = Chain(config=chain_config, logger=logger, index=chain_index)
+        asyncio.run(index_shard(chain=chain, shard=shard, validators=validators))
+    except KeyboardInterrupt:
+        exit(1)
 
-async def main():
-    async with AioHttpCalls(config=config, logger=logger, timeout=800) as session:
-        if not os.path.exists('metrics.json'):
+async def index_shard(chain, shard, validators):
+    config = chain.config
+    store = CheckpointStore(logger=chain.logger, path=shard['path'], compact_every=config.get('checkpoint_compact_every', 50), metrics=chain.metrics, log=chain.checkpoints.log)
+    start_height = shard['start_height']
+    if store.exists():
+        metrics_data = store.load()
+        validators = metrics_data['validators']
+        start_height = metrics_data['latest_height']
+
+    if start_height >= shard['end_height']:
+        return
+
+    async with AioHttpCalls(config=config, logger=chain.logger, timeout=800, metrics=chain.metrics) as session:
+        await parse_signatures_batches(
+            chain=chain,
+            validators=validators,
+            session=session,
+            start_height=start_height,
+            batch_size=config['batch_size'],
+            end_height=shard['end_height'],
+            store=store,
+            shard=shard
+        )
+
+def merge_shards(chain, plan, validators):
+    logger = chain.logger
+    windows_config = chain.config.get('windows') or {}
+    by_hex = {validator['hex']: validator for validator in validators if validator.get('hex')}
+
+    for shard in plan['shards']:
+        metrics_data = CheckpointStore(logger=logger, path=shard['path'], metrics=chain.metrics, log=chain.checkpoints.log).load()
+        if metrics_data['latest_height'] != shard['end_height']:
+            logger.error(f"Shard {shard['index']} stopped at {metrics_data['latest_height']} instead of {shard['end_height']}. Exiting")
+            exit(1)
+        # Heights a shard gave up on are retried by the parent once the backfill is merged
+        for start_height, end_height in metrics_data['missing_ranges']:
+            chain.checkpoints.gaps.add_range(start_height, end_height)
+
+        for shard_validator in metrics_data['validators']:
+            validator = by_hex.get(shard_validator.get('hex'))
+            if validator is None:
+                if not shard_validator.get('hex'):
+                    continue
+                # Discovered by the shard while backfilling
+                validator = {key: value for key, value in shard_validator.items() if key not in WINDOW_FIELDS}
+                validator.update({'total_signed_blocks': 0, 'total_missed_blocks': 0, 'total_proposed_blocks': 0, 'index': len(validators) + 1})
+                validators.append(validator)
+                by_hex[validator['hex']] = validator
+
+            validator['total_signed_blocks'] += shard_validator['total_signed_blocks']
+            validator['total_missed_blocks'] += shard_validator['total_missed_blocks']
+            validator['total_proposed_blocks'] += shard_validator['total_proposed_blocks']
+            if windows_config.get('enabled'):
+                merge_windows(
+                    validator,
+                    shard_validator,
+                    window=windows_config.get('signed_blocks_window', 10000),
+                    proposals_window=windows_config.get('proposals_window', 1000),
+                    end_height=shard['end_height']
+                )
+
+    return validators
+
+async def run_backfill(chain, plan, validators):
+    logger = chain.logger
+    context = multiprocessing.get_context('spawn')
+    max_restarts = chain.backfill_config.get('max_restarts', 3)
+
+    async def run(shard):
+        for attempt in range(max_restarts + 1):
+            process = context.Process(target=run_shard, args=(chain.config, chain.index, shard, plan['validators']))
+            process.start()
+            await asyncio.to_thread(process.join)
+            if process.exitcode == 0:
+                return True
+            logger.error(f"Shard {shard['index']} [{shard['start_height']}, {shard['end_height']}) exited with code {process.exitcode}. Restarting it from its checkpoint ({attempt + 1}/{max_restarts})")
+        return False
+
+    results = await asyncio.gather(*[run(shard) for shard in plan['shards']])
+    if not all(results):
+        logger.error("Some backfill shards keep failing. Restart to resume them from their checkpoints. Exiting")
+        exit(1)
+
+    return merge_shards(chain=chain, plan=plan, validators=validators)
+
+async def backfill(chain, session, plan, validators=None):
+    logger = chain.logger
+    archive = open_archive(chain=chain)
+    if archive is not None:
+        for validator in plan['validators']:
+            archive.slot(validator['hex'])
+        archive.close()
+
+    logger.info(f"Backfilling [{plan['start_height']}, {plan['end_height']}) with {len(plan['shards'])} worker processes")
+    # Shard counters are added to the fresh validator records so metadata fetched meanwhile is kept
+    validators = await run_backfill(chain=chain, plan=plan, validators=validators or zeroed_validators(plan['validators']))
+
+    await chain.checkpoints.snapshot(latest_height=plan['end_height'], validators=validators)
+    shutil.rmtree(chain.shards_path)
+
+    print('------------------------------------------------------------------------')
+    logger.info(f"Backfill merged. Continue indexing blocks from {plan['end_height']}")
+    latest_height = await parse_signatures_batches(chain=chain, validators=validators, session=session, start_height=plan['end_height'], batch_size=chain.config['batch_size'])
+    return validators, latest_height
+
+def write_backfill_plan(chain, plan):
+    os.makedirs(chain.shards_path, exist_ok=True)
+    temp_path = f"{chain.backfill_plan_path}.tmp"
+    with open(temp_path, 'w') as file:
+        json.dump(plan, file)
+    os.replace(temp_path, chain.backfill_plan_path)
+
+async def follow_chain(chain, validators, session, start_height):
+    config, logger, metrics = chain.config, chain.logger, chain.metrics
+    tally = open_tally(chain=chain, validators=validators)
+    registry = open_registry(chain=chain, validators=validators, session=session)
+    archive = open_archive(chain=chain)
+    max_vals = config.get('max_number_of_valdiators_ever_in_the_active_set') or 125
+    next_height = start_height
+    attempt = 0
+    metrics.validators = validators
+
+    # Missing heights are retried next to the live blocks, nothing waits for them
+    scheduler = open_gap_scheduler(
+        chain=chain,
+        store=chain.checkpoints,
+        fetch=lambda height: get_block_with_valset(session=session, height=height, max_vals=max_vals, registry=registry)
+    )
+    scheduler.schedule_ledger()
+
+    while True:
+        try:
+            previous = None
+            async for event in session.subscribe_new_blocks():
+                attempt = 0
+                # A NewBlock event carries the commit of the previous height, its header came with the previous event
+                header, previous = previous, event
+                commit_height = event['last_commit']['height']
+                metrics.progress(head_height=event['height'])
+                if commit_height < next_height:
+                    continue
+
+                if commit_height > next_height:
+                    logger.info(f"Backfilling missed heights [{next_height}, {commit_height})")
+                    if archive is not None:
+                        archive.close()
+                    next_height = await parse_signatures_batches(chain=chain, validators=validators, session=session, start_height=next_height, batch_size=config['batch_size'], end_height=commit_height, scheduler=scheduler, registry=registry)
+                    archive = open_archive(chain=chain)
+                    tally = open_tally(chain=chain, validators=validators)
+
+                if header is not None and header['height'] == commit_height:
+                    block = {"height": commit_height, "signatures": event['last_commit']['signatures'], "proposer": header['proposer'], "validators_hash": header['validators_hash']}
+                else:
+                    block = await session.get_block(height=commit_height)
+                    if block is None:
+                        logger.warning(f"Failed to fetch block {commit_height}, it will be backfilled with the next one")
+                        continue
+
+                valset = await session.valset_cache.get(
+                    block['validators_hash'],
+                    lambda: get_registered_valset(session=session, height=commit_height, max_vals=max_vals, registry=registry)
+                )
+                if valset is None:
+                    logger.warning(f"Failed to fetch valset at {commit_height}, it will be backfilled with the next block")
+                    continue
+
+                late_blocks = add_late_blocks(scheduler=scheduler, tally=tally, archive=archive)
+                cpu_time = time.thread_time()
+                tally.add_block(block, valset)
+                deltas = tally.flush()
+                missing = chain.checkpoints.gaps.ranges()
+                metrics.tally_cpu.observe(time.thread_time() - cpu_time)
+                if archive is not None:
+                    archive.add_block(block, valset)
+                    await asyncio.to_thread(archive.flush)
+                await chain.checkpoints.save(start_height=commit_height, end_height=commit_height + 1, deltas=deltas, validators=validators, missing=missing)
+                next_height = commit_height + 1
+                metrics.blocks.inc()
+                metrics.progress(indexed_height=next_height)
+                metrics.missing_heights.set(len(chain.checkpoints.gaps))
+                if late_blocks:
+                    logger.info(f"Counted {len(late_blocks)} missing heights, {len(chain.checkpoints.gaps)} left")
+                logger.debug(f"Indexed live block {commit_height}")
+
+            logger.warning("Websocket closed by the node")
+
+        except (aiohttp.ClientError, TimeoutError) as e:
+            logger.warning(f"Websocket connection failed: {e}")
+
+        attempt += 1
+        delay = jittered_backoff(attempt)
+        logger.info(f"Reconnecting to the websocket in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+async def index_chain(chain, client_session=None):
+    config, logger, checkpoints = chain.config, chain.logger, chain.checkpoints
+    async with AioHttpCalls(config=config, logger=logger, timeout=800, metrics=chain.metrics, client_session=client_session) as session:
+        chain.metrics.pools = {'rpc': session.rpc, 'api': session.api}
+
+        metadata = None
+        if not checkpoints.exists() and os.path.exists(chain.backfill_plan_path):
+            with open(chain.backfill_plan_path, 'r') as file:
+                plan = json.load(file)
+            print('------------------------------------------------------------------------')
+            logger.info(f"Resuming backfill of [{plan['start_height']}, {plan['end_height']})")
+            validators, latest_height = await backfill(chain=chain, session=session, plan=plan)
+
+        elif not checkpoints.exists():
             print('------------------------------------------------------------------------')
             logger.info('Fetching latest validators set')
-            validators = await get_validators(session=session)
+            validators = await get_validators(chain=chain, session=session)
             
             if not validators:
                 logger.error("Failed to fetch validators. API is not reachable. Exiting")
                 exit(1)
             
-            total_vals = len(validators)
-
-            if config['metrics']['jails']:
-                print('------------------------------------------------------------------------')
-                logger.info('Fetching slashing info')
-                validators = await get_slashing_info(validators=validators, session=session, total_vals=total_vals)
-
-            if config['metrics']['delegators']:
-                print('------------------------------------------------------------------------')
-                logger.info('Fetching delegators info')
-                validators = await get_delegators_number(validators=validators, session=session, total_vals=total_vals)
-
-            if config['metrics']['delegators']:
-                print('------------------------------------------------------------------------')
-                logger.info('Fetching double sign info')
-                validators = await check_valdiator_tomb(validators=validators, session=session, total_vals=total_vals)
-            
-
+            # Metadata lookups run in the background while blocks are indexed
+            metadata = asyncio.create_task(fetch_validator_metadata(chain=chain, validators=validators, session=session))
 
             # if config['metrics']['validator_creation_block']:
                 # print('------------------------------------------------------------------------')
@@ -233,16 +591,73 @@ async def main():
             logger.info(f'Indexing blocks from the height: {start_height}')
             print('------------------------------------------------------------------------')
 
-            await parse_signatures_batches(validators=validators, session=session, start_height=start_height, batch_size=config['batch_size'])
+            workers = chain.backfill_config.get('workers', 1)
+            rpc_latest_height = await session.get_latest_block_height_rpc()
+            if workers > 1 and rpc_latest_height and rpc_latest_height - start_height > workers * config['batch_size']:
+                plan = plan_backfill(chain=chain, validators=validators, start_height=start_height, end_height=rpc_latest_height, workers=workers)
+                write_backfill_plan(chain=chain, plan=plan)
+                validators, latest_height = await backfill(chain=chain, session=session, plan=plan, validators=validators)
+            else:
+                latest_height = await parse_signatures_batches(chain=chain, validators=validators, session=session, start_height=start_height, batch_size=config['batch_size'])
         else:
+            if os.path.exists(chain.shards_path):
+                shutil.rmtree(chain.shards_path)
+
+            metrics_data = checkpoints.load()
+            validators = metrics_data.get('validators')
+            latest_indexed_height = metrics_data.get('latest_height', 1)
+            metadata = asyncio.create_task(fetch_validator_metadata(chain=chain, validators=validators, session=session))
+            print('------------------------------------------------------------------------')
+            logger.info(f"Continue indexing blocks from {metrics_data.get('latest_height')}")
+            latest_height = await parse_signatures_batches(chain=chain, validators=validators, session=session, start_height=latest_indexed_height, batch_size=config['batch_size'])
 
-            with open('metrics.json', 'r') as file:
-                metrics_data = json.load(file)
-                validators = metrics_data.get('validators')
-                latest_indexed_height = metrics_data.get('latest_height', 1)
-                print('------------------------------------------------------------------------')
-                logger.info(f"Continue indexing blocks from {metrics_data.get('latest_height')}")
-                await parse_signatures_batches(validators=validators, session=session, start_height=latest_indexed_height, batch_size=config['batch_size'])
+        if metadata is None:
+            metadata = asyncio.create_task(fetch_validator_metadata(chain=chain, validators=validators, session=session))
+        if await metadata:
+            await checkpoints.snapshot(latest_height=latest_height, validators=validators)
+
+        if config.get('follow'):
+            print('------------------------------------------------------------------------')
+            logger.info(f"Caught up at {latest_height}. Following new blocks")
+            await follow_chain(chain=chain, validators=validators, session=session, start_height=latest_height)
+
+async def run_chain(chain, client_session):
+    # A chain that gives up must not take the other pipelines of the process down with it
+    try:
+        await index_chain(chain=chain, client_session=client_session)
+        return True
+    except SystemExit:
+        chain.logger.error("Stopped indexing this chain, the other chains keep running")
+        return False
+
+async def main():
+    configs = chain_configs(config)
+    names = [chain_config.get('name') for chain_config in configs]
+    if len(configs) > 1 and (None in names or len(set(names)) != len(names)):
+        logger.error("Every entry in chains needs a unique name. Exiting")
+        exit(1)
+    chains = [Chain(config=chain_config, logger=logger, index=index) for index, chain_config in enumerate(configs)]
+
+    server = None
+    prometheus_config = config.get('prometheus') or {}
+    if prometheus_config.get('enabled'):
+        server = MetricsServer(logger=logger, registries=[chain.metrics for chain in chains])
+        await server.start(host=prometheus_config.get('host', '0.0.0.0'), port=prometheus_config.get('port', 9100))
+
+    if not config.get('chains'):
+        await index_chain(chain=chains[0])
+        results = [True]
+    else:
+        # One connector for every chain, its limit is the global connection budget and connections are pooled per host
+        connector = aiohttp.TCPConnector(limit=config.get('max_connections', 100), limit_per_host=config.get('max_connections_per_host', 0))
+        async with aiohttp.ClientSession(connector=connector) as client_session:
+            logger.info(f"Indexing {len(chains)} chains: {', '.join(names)}")
+            results = await asyncio.gather(*[run_chain(chain=chain, client_session=client_session) for chain in chains])
+
+    if server is not None:
+        await server.stop()
+    if not all(results):
+        exit(1)
 
 if __name__ == "__main__":
     try:
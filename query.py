@@ -0,0 +1,47 @@
+import json
+import os
+from sys import argv, exit
+from yaml import safe_load
+from utils.logger import setup_logger
+from utils.archive import SigningArchive
+from utils.chains import chain_configs
+
+with open('config.yaml', 'r') as config_file:
+    config = safe_load(config_file)
+
+logger = setup_logger(log_level=config['log_lvl'])
+
+def main():
+    if len(argv) not in (3, 4):
+        logger.error("Usage: python3 query.py <start_height> <end_height> [chain]")
+        exit(1)
+
+    chains = {chain_config.get('name'): chain_config for chain_config in chain_configs(config)}
+    chain_config = chains.get(argv[3] if len(argv) == 4 else next(iter(chains)))
+    if chain_config is None:
+        logger.error(f"Unknown chain {argv[3]}. Configured chains: {', '.join(chains)}")
+        exit(1)
+
+    archive_config = chain_config.get('archive') or {}
+    archive_path = archive_config.get('path', 'archive')
+    if not os.path.exists(os.path.join(archive_path, 'meta.json')):
+        logger.error(f"No signing archive found at {archive_path}. Enable archive in config and index some blocks first")
+        exit(1)
+
+    monikers = {}
+    metrics_path = os.path.join(chain_config.get('namespace', ''), 'metrics.json')
+    if os.path.exists(metrics_path):
+        with open(metrics_path, 'r') as file:
+            for validator in json.load(file)['validators']:
+                monikers[validator.get('hex')] = validator.get('moniker')
+
+    archive = SigningArchive(logger=logger, path=archive_path, allocate=False)
+    result = archive.query(start_height=int(argv[1]), end_height=int(argv[2]))
+    archive.close()
+
+    for hex_address, stats in result['validators'].items():
+        stats['moniker'] = monikers.get(hex_address)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
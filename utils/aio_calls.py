@@ -1,7 +1,35 @@
+import asyncio
 import aiohttp
 import traceback
 import time
 import json
+from urllib.parse import quote
+from utils.valset_cache import ValsetCache
+from utils.concurrency import jittered_backoff
+from utils.endpoints import EndpointPool
+from utils.jsonrpc import JsonRpcBatcher
+from utils.metrics import IndexerMetrics
+from utils.response_cache import ResponseCache
+from utils.codec import loads, decode_commit, decode_valset, decode_batch, commit_from_result, valset_from_result
+
+def request_kind(path):
+    # Heights and addresses are dropped, every validator and every height share one kind
+    parts = [part for part in path.split('?')[0].split('/') if part]
+    if not parts:
+        return 'batch'
+    return '/'.join('*' if part.isdigit() or len(part) > 30 else part for part in parts)
+
+# Retry flag of a request the node refused with a JSON-RPC error, another endpoint may still serve it
+RPC_ERROR = 'rpc_error'
+
+async def rpc_error(response):
+    # CometBFT answers every failed call with a 500 and a JSON-RPC error, proxies in front of an overloaded node do not
+    try:
+        data = await response.json(loads=loads, content_type=None)
+    except Exception:
+        return None
+    error = data.get('error') if isinstance(data, dict) else None
+    return error if isinstance(error, dict) else None
 
 class AioHttpCalls:
 
@@ -9,94 +37,229 @@ class AioHttpCalls:
                  self,
                  config,
                  logger,
-                 timeout = 10
+                 timeout = 10,
+                 metrics = None,
+                 client_session = None
                  ):
                  
-        self.api = config['api']
-        self.rpc = config['rpc']
+        self.api = EndpointPool(urls=config['api'], config=config, logger=logger)
+        self.rpc = EndpointPool(urls=config['rpc'], config=config, logger=logger)
         self.logger = logger
         self.timeout = timeout
+        self.metrics = metrics or IndexerMetrics(logger=logger)
+        self.client_session = client_session
         self.session = None
+        self.monitor = None
+        self.valset_cache = ValsetCache(max_size=config.get('valset_cache_size', 64))
+        self.max_retries = config.get('max_retries', 5)
+        self.health_check_interval = config.get('health_check_interval', 60)
+        self.rpc_batch_failures = 0
+        self.batcher = None
+        if config.get('rpc_batch_size', 1) > 1:
+            self.batcher = JsonRpcBatcher(send=self.send_batch, width=config['rpc_batch_size'])
+        self.cache = None
+        cache_config = config.get('cache') or {}
+        if cache_config.get('enabled'):
+            self.cache = ResponseCache(
+                logger=logger,
+                path=cache_config.get('path', 'cache'),
+                max_size_mb=cache_config.get('max_size_mb', 2048),
+                replay=cache_config.get('replay', False)
+            )
 
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
+        # Chains indexed by one process share a session, its connector pools connections per host
+        self.session = self.client_session or aiohttp.ClientSession()
+        await self.check_endpoints()
+        self.monitor = asyncio.create_task(self.monitor_endpoints())
         return self
 
     async def __aexit__(self, exc_type, exc_value, traceback):
-        await self.session.close()
+        self.monitor.cancel()
+        if self.cache is not None:
+            await self.cache.close()
+        if self.client_session is None:
+            await self.session.close()
+
+    async def check_endpoints(self):
+        async def check_rpc(endpoint):
+            endpoint.lowest_height = await self.probe_lowest_height(endpoint)
+            endpoint.healthy = endpoint.lowest_height is not None
+
+        async def check_api(endpoint):
+            endpoint.healthy = await self.probe_api(endpoint) is not None
+
+        await asyncio.gather(
+            *[check_rpc(endpoint) for endpoint in self.rpc],
+            *[check_api(endpoint) for endpoint in self.api]
+        )
+        for endpoint in [*self.rpc, *self.api]:
+            if not endpoint.healthy:
+                self.logger.debug(f"Endpoint {endpoint.url} failed health check")
+
+    async def monitor_endpoints(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await self.check_endpoints()
     
-    async def handle_request(self, url, callback, include_latency=False):
+    async def handle_request(self, pool, path, callback, include_latency=False, height=None, raw=False):
+        failed = None
+        refused = set()
+        attempt = 0
+        while True:
+            endpoint = pool.pick(height=height, exclude=failed, refused=refused)
+            if endpoint is None:
+                self.metrics.failures.inc(kind=request_kind(path))
+                self.logger.debug(f"Giving up on {path}, every endpoint serving it answered with an RPC error")
+                return None
+
+            data, retry = await self.request(endpoint, path, callback, include_latency, raw=raw)
+            if not retry:
+                return data
+            if retry == RPC_ERROR:
+                # A pruned or lagging node says nothing about load, the next endpoint is asked right away
+                refused.add(endpoint)
+                continue
+
+            failed = endpoint
+            if attempt == self.max_retries:
+                break
+            attempt += 1
+            self.metrics.retries.inc(kind=request_kind(path))
+            await asyncio.sleep(jittered_backoff(attempt))
+
+        self.metrics.failures.inc(kind=request_kind(path))
+        self.logger.debug(f"Giving up on {path} after {self.max_retries} retries")
+        return None
+
+    async def request(self, endpoint, path, callback, include_latency=False, payload=None, raw=False):
+        url = f"{endpoint.url}{path}"
+        await endpoint.limiter.acquire()
+        start_time = time.time()
+        congested = False
+        outcome = 'error'
         try:
-            start_time = time.time()
-            async with self.session.get(url, timeout=self.timeout) as response:
+            method = 'GET' if payload is None else 'POST'
+            async with self.session.request(method, url, json=payload, timeout=self.timeout) as response:
                 end_time = time.time()
                 
                 if 200 <= response.status < 300:
-                    data = await callback(response.json())
+                    # Raw callbacks decode the body themselves and skip building the full document
+                    data = await callback(response.read() if raw else response.json(loads=loads))
                     if include_latency:
                         data['latency'] = round(end_time - start_time, 2)
-                    return data
+                    outcome = 'ok'
+                    return data, False
                 
                 elif response.status == 500 and '/block?height=1' in url:
-                    data = await callback(response.json())
-                    return data
+                    data = await callback(response.json(loads=loads))
+                    outcome = 'ok'
+                    return data, False
         
                 else:
+                    # Out of range pages and pruned heights fail the same way on every retry, and say nothing about load
+                    error = await rpc_error(response) if response.status >= 500 else None
+                    if error is not None:
+                        self.logger.debug(f"Request to {url} failed with RPC error {error.get('code')}: {error.get('data') or error.get('message')}")
+                        outcome = 'rpc_error'
+                        return None, RPC_ERROR
+
                     self.logger.debug(f"Request to {url} failed with status code {response.status}")
-                    return None
+                    congested = response.status == 429 or response.status >= 500
+                    outcome = f"http_{response.status}"
+                    return None, congested
                 
         except aiohttp.ClientError as e:
             self.logger.debug(f"Issue with making request to {url}: {e}")
-            return None
+            congested = True
+            outcome = 'connection_error'
+            return None, True
         
         except TimeoutError as e:
             self.logger.debug(f"Issue with making request to {url}. TimeoutError: {e}")
-            return None
+            congested = True
+            outcome = 'timeout'
+            return None, True
 
         except Exception as e:
             self.logger.debug(f"An unexpected error occurred: {e}")
             traceback.print_exc()
-            return None
+            return None, False
+
+        finally:
+            latency = time.time() - start_time
+            kind = request_kind(path)
+            endpoint.limiter.release(latency=latency, congested=congested, kind=kind)
+            endpoint.record(latency=latency, ok=not congested)
+            self.metrics.requests.inc(kind=kind, outcome=outcome)
+            self.metrics.request_latency.observe(latency, kind=kind)
+
+    async def send_batch(self, calls):
+        payload = []
+        for request_id, (method, params) in enumerate(calls):
+            payload.append({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params})
+
+        async def process_response(response):
+            return decode_batch(await response)
+
+        endpoint = self.rpc.pick(height=min(int(params['height']) for _, params in calls))
+        results, retry = await self.request(endpoint, "/", process_response, payload=payload, raw=True)
+
+        if results is None:
+            # Timeouts and 5xx fall back for this batch only, a node refusing batches is dropped after a few tries
+            if not retry:
+                self.rpc_batch_failures += 1
+            if self.rpc_batch_failures >= 3 and self.batcher is not None:
+                self.logger.warning("RPC does not accept JSON-RPC batch requests. Falling back to one request per height")
+                self.batcher = None
+            return [None] * len(calls)
+
+        self.rpc_batch_failures = 0
+        return [results.get(request_id) for request_id in range(len(calls))]
     
     async def get_latest_block_height_rpc(self) -> str:
-        url = f"{self.rpc}/abci_info"
+        if self.cache is not None and self.cache.replay:
+            _, latest_height = self.cache.heights()
+            return latest_height + 1 if latest_height is not None else None
+
+        path = "/abci_info"
 
         async def process_response(response):
             data = await response
             return int(data.get('result', {}).get('response', {}).get('last_block_height'))
         
-        return await self.handle_request(url, process_response)
+        return await self.handle_request(self.rpc, path, process_response)
 
     async def get_total_delegators(self, valoper: str) -> str:
-        url = f"{self.api}/cosmos/staking/v1beta1/validators/{valoper}/delegations?pagination.count_total=true"
+        path = f"/cosmos/staking/v1beta1/validators/{valoper}/delegations?pagination.count_total=true"
         
         async def process_response(response):
             data = await response
             return int(data.get('pagination', {}).get('total', 0))
         
-        return await self.handle_request(url, process_response)
+        return await self.handle_request(self.api, path, process_response)
     
     async def get_validator_tomb(self, valcons: str) -> dict:
-        url = f"{self.api}/cosmos/slashing/v1beta1/signing_infos/{valcons}"
+        path = f"/cosmos/slashing/v1beta1/signing_infos/{valcons}"
 
         async def process_response(response):
             data = await response
             return data.get('val_signing_info',{}).get('tombstoned', False)
 
-        return await self.handle_request(url, process_response) 
+        return await self.handle_request(self.api, path, process_response) 
     
     async def get_validator_creation_block(self, valoper: str) -> dict:
-        url=f"{self.api}/cosmos/tx/v1beta1/txs?events=create_validator.validator%3D%27{valoper}%27"
+        path = f"/cosmos/tx/v1beta1/txs?events=create_validator.validator%3D%27{valoper}%27"
 
         async def process_response(response):
             data = await response
             if data.get('tx_responses', []):
                 return {'block': data.get('tx_responses',[{}])[0].get('height'),'time': data.get('tx_responses',[{}])[0].get('timestamp'), 'txhash': data.get('tx_responses',[{}])[0].get('txhash')}
 
-        return await self.handle_request(url, process_response)
+        return await self.handle_request(self.api, path, process_response)
 
     async def get_transactions_count(self, wallet: str) -> dict:
-        url=f"{self.rpc}/tx_search?query=%22message.sender=%27{wallet}%27%22"
+        path = f"/tx_search?query=%22message.sender=%27{wallet}%27%22"
 
         async def process_response(response):
             data = await response
@@ -123,16 +286,16 @@ class AioHttpCalls:
 
                 return {'successful': status_0_count,'failed': other_status_count, 'total': data.get('result',{}).get('total_count', 0), 'gov_participate': governance_participation}
 
-        return await self.handle_request(url, process_response)
+        return await self.handle_request(self.rpc, path, process_response)
 
     async def get_validators(self, status: str = None) -> dict:
         status_urls = {
-            "BOND_STATUS_BONDED": f"{self.api}/cosmos/staking/v1beta1/validators?status=BOND_STATUS_BONDED&pagination.limit=100000",
-            "BOND_STATUS_UNBONDED": f"{self.api}/cosmos/staking/v1beta1/validators?status=BOND_STATUS_UNBONDED&pagination.limit=100000",
-            "BOND_STATUS_UNBONDING": f"{self.api}/cosmos/staking/v1beta1/validators?status=BOND_STATUS_UNBONDING&pagination.limit=100000",
-            None: f"{self.api}/cosmos/staking/v1beta1/validators?&pagination.limit=100000"
+            "BOND_STATUS_BONDED": "/cosmos/staking/v1beta1/validators?status=BOND_STATUS_BONDED&pagination.limit=100000",
+            "BOND_STATUS_UNBONDED": "/cosmos/staking/v1beta1/validators?status=BOND_STATUS_UNBONDED&pagination.limit=100000",
+            "BOND_STATUS_UNBONDING": "/cosmos/staking/v1beta1/validators?status=BOND_STATUS_UNBONDING&pagination.limit=100000",
+            None: "/cosmos/staking/v1beta1/validators?&pagination.limit=100000"
         }
-        url = status_urls.get(status, status_urls[None])
+        path = status_urls.get(status, status_urls[None])
         async def process_response(response):
             data = await response
             validators = []
@@ -145,22 +308,38 @@ class AioHttpCalls:
                 validators.append(info)
             return validators
         
-        return await self.handle_request(url, process_response)
+        return await self.handle_request(self.api, path, process_response)
     
-    async def get_slashing_info_archive(self, valcons: str):
-        url = f'{self.rpc}/block_search?query="slash.address%3D%27{valcons}%27"'
+    async def get_slashing_info_archive(self, valcons: str, min_height: int = None, max_height: int = None, per_page: int = 100):
+        query = f"slash.address='{valcons}'"
+        if min_height is not None:
+            query += f" AND block.height>{min_height}"
+        if max_height is not None:
+            query += f" AND block.height<={max_height}"
         
         async def process_response(response):
             blocks = []
             data = await response
-            if data.get('result',{}).get('blocks'):
-                for block in data['result']['blocks']:
-                    blocks.append({'height': block.get('block',{}).get('header',{}).get('height'), 'time': block.get('block',{}).get('header',{}).get('time')})
+            for block in data.get('result',{}).get('blocks') or []:
+                blocks.append({'height': block.get('block',{}).get('header',{}).get('height'), 'time': block.get('block',{}).get('header',{}).get('time')})
+            return blocks, int(data.get('result',{}).get('total_count', 0))
+
+        blocks = []
+        page = 1
+        while True:
+            path = f'/block_search?query={quote(chr(34) + query + chr(34))}&page={page}&per_page={per_page}&order_by=%22asc%22'
+            data = await self.handle_request(self.rpc, path, process_response, height=(min_height or 0) + 1)
+            if data is None:
+                return None
+
+            page_blocks, total_count = data
+            blocks.extend(page_blocks)
+            if not page_blocks or len(blocks) >= total_count:
                 return blocks
-        return await self.handle_request(url, process_response)
+            page += 1
     
     async def get_valset_at_block(self, height):
-        url = f"{self.api}/cosmos/base/tendermint/v1beta1/validatorsets/{height}?&pagination.limit=100000"
+        path = f"/cosmos/base/tendermint/v1beta1/validatorsets/{height}?&pagination.limit=100000"
         
         async def process_response(response):
             data = await response
@@ -169,39 +348,98 @@ class AioHttpCalls:
                 valcons.append(validator['address'])
             return {'height': height, 'vaset': valcons}
         
-        return await self.handle_request(url, process_response)
+        return await self.handle_request(self.api, path, process_response, height=height)
     
+    def parse_commit(self, result, height):
+        return {"height": height, **commit_from_result(result)}
+
+    def parse_valset_hex(self, result):
+        return valset_from_result(result)
+
     async def get_block(self, height):
-        url = f"{self.rpc}/commit?height={height}"
+        if self.cache is not None:
+            block = self.cache.get_commit(height)
+            if block is not None or self.cache.replay:
+                return block
+
+        block = await self.fetch_block(height)
+        if block is not None and self.cache is not None:
+            self.cache.put_commit(block)
+        return block
+
+    async def fetch_block(self, height):
+        path = f"/commit?height={height}"
 
         async def process_response(response):
-            data = await response
-            signatures = []
-        
-            for signature in data['result']['signed_header']['commit']['signatures']:
-                signatures.append(signature['validator_address'])
-            proposer = data['result']['signed_header']['header']['proposer_address']
-            
-            return {"height": height, "signatures": signatures, "proposer": proposer}
+            return {"height": height, **decode_commit(await response)}
+
+        if self.batcher is not None:
+            result = await self.batcher.call('commit', {'height': str(height)})
+            if result is not None:
+                return self.parse_commit(result, height)
 
-        return await self.handle_request(url, process_response)
+        return await self.handle_request(self.rpc, path, process_response, height=height, raw=True)
     
 
     async def get_valset_at_block_hex(self, height, page):
-        url = f"{self.rpc}/validators?height={height}&page={page}&per_page=100"
+        if self.cache is not None:
+            page_data = self.cache.get_valset_page(height, page)
+            if page_data is not None or self.cache.replay:
+                return page_data
+
+        page_data = await self.fetch_valset_page(height, page)
+        if page_data is not None and self.cache is not None:
+            self.cache.put_valset_page(height, page, *page_data)
+        return page_data
+
+    async def fetch_valset_page(self, height, page):
+        path = f"/validators?height={height}&page={page}&per_page=100"
         
         async def process_response(response):
-            data = await response
-            valset_hex = []
-            for validator in data['result']['validators']:
-                valset_hex.append(validator['address'])
+            return decode_valset(await response)
 
-            return valset_hex
+        if self.batcher is not None:
+            result = await self.batcher.call('validators', {'height': str(height), 'page': str(page), 'per_page': '100'})
+            if result is not None:
+                return self.parse_valset_hex(result)
         
-        return await self.handle_request(url, process_response)
+        return await self.handle_request(self.rpc, path, process_response, height=height, raw=True)
     
-    async def fetch_lowest_height(self):
-        url = f"{self.rpc}/block?height=1"
+    def parse_new_block(self, block):
+        header = block['header']
+        last_commit = block.get('last_commit') or {}
+        signatures = []
+
+        for signature in last_commit.get('signatures') or []:
+            signatures.append(signature['validator_address'])
+
+        return {
+            "height": int(header['height']),
+            "proposer": header['proposer_address'],
+            "validators_hash": header.get('validators_hash'),
+            "last_commit": {"height": int(last_commit.get('height', 0)), "signatures": signatures}
+        }
+
+    async def subscribe_new_blocks(self):
+        endpoint = self.rpc.pick()
+        url = f"ws{endpoint.url[4:]}/websocket" if endpoint.url.startswith('http') else f"{endpoint.url}/websocket"
+        subscribe = {"jsonrpc": "2.0", "method": "subscribe", "id": 0, "params": {"query": "tm.event='NewBlock'"}}
+
+        async with self.session.ws_connect(url, heartbeat=30) as websocket:
+            await websocket.send_json(subscribe)
+            self.logger.info(f"Subscribed to new blocks on {url}")
+
+            async for message in websocket:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    break
+
+                data = loads(message.data)
+                block = data.get('result', {}).get('data', {}).get('value', {}).get('block')
+                if block:
+                    yield self.parse_new_block(block)
+
+    async def probe_lowest_height(self, endpoint):
+        path = "/block?height=1"
 
         async def process_response(response):
             data = await response
@@ -214,6 +452,23 @@ class AioHttpCalls:
             
             return int(data.get("result", {}).get("block", {}).get("header", {}).get("height"))
                 
-        return await self.handle_request(url, process_response)
+        data, _ = await self.request(endpoint, path, process_response)
+        return data
+
+    async def probe_api(self, endpoint):
+        path = "/cosmos/base/tendermint/v1beta1/node_info"
+
+        async def process_response(response):
+            data = await response
+            return data.get('default_node_info', {}).get('network')
+
+        data, _ = await self.request(endpoint, path, process_response)
+        return data
+
+    async def fetch_lowest_height(self):
+        if self.cache is not None and self.cache.replay:
+            lowest_height, _ = self.cache.heights()
+            return lowest_height
 
-        
\ No newline at end of file
+        await self.check_endpoints()
+        return self.rpc.lowest_height()
@@ -0,0 +1,175 @@
+import fcntl
+import json
+import mmap
+import os
+import sys
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+
+class SigningArchive:
+
+    def __init__(self, logger, path='archive', capacity=1024, segment_heights=65536, allocate=True):
+        self.logger = logger
+        self.allocate = allocate
+        self.path = path
+        self.meta_path = os.path.join(path, 'meta.json')
+        self.lock_path = os.path.join(path, 'meta.lock')
+        os.makedirs(path, exist_ok=True)
+
+        # Proposers are stored as slot + 1 in an unsigned short, 0 means no proposer recorded
+        self.capacity = min(capacity, 65534)
+        self.segment_heights = segment_heights
+        self.validators = []
+        self.slots = {}
+        self.segments = {}
+        self.full = False
+        with self.meta_lock():
+            if os.path.exists(self.meta_path):
+                self.read_meta()
+            elif allocate:
+                self.write_meta()
+
+        # Per segment: signed bitmap per slot, active bitmap per slot, indexed bitmap, proposer array
+        self.bitmap_size = self.segment_heights // 8
+        self.active_offset = self.capacity * self.bitmap_size
+        self.indexed_offset = 2 * self.capacity * self.bitmap_size
+        self.proposer_offset = self.indexed_offset + self.bitmap_size
+        self.segment_size = self.proposer_offset + 2 * self.segment_heights
+
+    def slot(self, hex_address):
+        slot = self.slots.get(hex_address)
+        if slot is None and self.allocate:
+            # Backfill workers allocate concurrently, slots they assigned since the archive was opened are picked up first
+            with self.meta_lock():
+                self.read_meta()
+                slot = self.slots.get(hex_address)
+                if slot is not None:
+                    return slot
+                if len(self.validators) >= self.capacity:
+                    if not self.full:
+                        self.logger.warning(f"Signing archive is full ({self.capacity} validators), {hex_address} and later validators are not archived")
+                        self.full = True
+                    return None
+                slot = len(self.validators)
+                self.validators.append(hex_address)
+                self.slots[hex_address] = slot
+                # Slots must be on disk before any bit that refers to them, or a crash would reshuffle them on resume
+                self.write_meta()
+        return slot
+
+    @contextmanager
+    def meta_lock(self):
+        with open(self.lock_path, 'a') as file:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+    def segment(self, number, create=True):
+        segment = self.segments.get(number)
+        if segment is not None:
+            return segment
+
+        segment_path = os.path.join(self.path, f"segment_{number:06d}.bin")
+        if not create and not os.path.exists(segment_path):
+            return None
+
+        # Never truncate an existing segment, backfill workers may be creating the same one concurrently
+        with open(segment_path, 'ab') as file:
+            if file.tell() < self.segment_size:
+                # Sparse file, pages of validators that never sign in this segment stay unallocated
+                file.truncate(self.segment_size)
+
+        with open(segment_path, 'r+b') as file:
+            segment = mmap.mmap(file.fileno(), self.segment_size)
+        self.segments[number] = segment
+        return segment
+
+    def set_bit(self, segment, offset, position):
+        index = offset + position // 8
+        segment[index] = segment[index] | (1 << (position % 8))
+
+    def add_block(self, block, valset):
+        number, position = divmod(block['height'], self.segment_heights)
+        segment = self.segment(number)
+        signatures = set(block['signatures'])
+
+        for hex_address in valset:
+            slot = self.slot(hex_address)
+            if slot is None:
+                continue
+            self.set_bit(segment, self.active_offset + slot * self.bitmap_size, position)
+            if hex_address in signatures:
+                self.set_bit(segment, slot * self.bitmap_size, position)
+
+        proposer = self.slots.get(block['proposer'])
+        if proposer is not None and block['proposer'] in valset:
+            index = self.proposer_offset + 2 * position
+            segment[index:index + 2] = (proposer + 1).to_bytes(2, 'little')
+
+        self.set_bit(segment, self.indexed_offset, position)
+
+    def count_bits(self, segment, offset, start, end):
+        chunk = segment[offset + start // 8:offset + (end + 7) // 8]
+        bits = int.from_bytes(chunk, 'little') >> (start % 8)
+        return (bits & ((1 << (end - start)) - 1)).bit_count()
+
+    def query(self, start_height, end_height):
+        stats = {hex_address: {'signed': 0, 'missed': 0, 'proposed': 0} for hex_address in self.validators}
+        indexed = 0
+
+        first_segment = start_height // self.segment_heights
+        last_segment = (end_height - 1) // self.segment_heights
+        for number in range(first_segment, last_segment + 1):
+            segment = self.segment(number, create=False)
+            if segment is None:
+                continue
+
+            base = number * self.segment_heights
+            start = max(start_height, base) - base
+            end = min(end_height, base + self.segment_heights) - base
+
+            indexed += self.count_bits(segment, self.indexed_offset, start, end)
+            for slot, hex_address in enumerate(self.validators):
+                signed = self.count_bits(segment, slot * self.bitmap_size, start, end)
+                active = self.count_bits(segment, self.active_offset + slot * self.bitmap_size, start, end)
+                stats[hex_address]['signed'] += signed
+                stats[hex_address]['missed'] += active - signed
+
+            proposers = array('H', segment[self.proposer_offset + 2 * start:self.proposer_offset + 2 * end])
+            if sys.byteorder == 'big':
+                proposers.byteswap()
+            proposers = Counter(proposers)
+            for proposer, proposed in proposers.items():
+                if proposer:
+                    stats[self.validators[proposer - 1]]['proposed'] += proposed
+
+        return {'start_height': start_height, 'end_height': end_height, 'indexed_heights': indexed, 'validators': stats}
+
+    def flush(self):
+        for segment in self.segments.values():
+            segment.flush()
+
+    def read_meta(self):
+        with open(self.meta_path, 'r') as file:
+            meta = json.load(file)
+        self.capacity = meta['capacity']
+        self.segment_heights = meta['segment_heights']
+        self.validators = meta['validators']
+        self.slots = {hex_address: slot for slot, hex_address in enumerate(self.validators)}
+
+    def write_meta(self):
+        temp_path = f"{self.meta_path}.tmp"
+        with open(temp_path, 'w') as file:
+            json.dump({'capacity': self.capacity, 'segment_heights': self.segment_heights, 'validators': self.validators}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.meta_path)
+
+    def close(self):
+        self.flush()
+        for segment in self.segments.values():
+            segment.close()
+        self.segments = {}
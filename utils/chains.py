@@ -0,0 +1,71 @@
+import logging
+import os
+from utils.decoder import Decoder
+from utils.checkpoint import CheckpointStore
+from utils.export import SqliteExport
+from utils.metrics import IndexerMetrics
+
+# Sections that write to disk, their paths are moved under the namespace of each chain
+OUTPUT_SECTIONS = {'archive': 'archive', 'cache': 'cache', 'backfill': 'shards'}
+
+def chain_configs(config):
+    if not config.get('chains'):
+        return [config]
+
+    # Chain entries override the top level keys, anything not set per chain is shared
+    base = {key: value for key, value in config.items() if key != 'chains'}
+    configs = []
+    for chain in config['chains']:
+        chain_config = {**base, **chain}
+        namespace = chain.get('namespace') or chain['name']
+        chain_config['namespace'] = namespace
+        for section, default_path in OUTPUT_SECTIONS.items():
+            section_config = dict(chain_config.get(section) or {})
+            section_config['path'] = os.path.join(namespace, section_config.get('path', default_path))
+            chain_config[section] = section_config
+        configs.append(chain_config)
+    return configs
+
+class ChainLogger(logging.LoggerAdapter):
+
+    def process(self, msg, kwargs):
+        return f"[{self.extra['chain']}] {msg}", kwargs
+
+class Chain:
+
+    def __init__(self, config, logger, index=0):
+        self.config = config
+        self.index = index
+        self.name = config.get('name')
+        self.namespace = config.get('namespace', '')
+        if self.namespace:
+            os.makedirs(self.namespace, exist_ok=True)
+
+        self.logger = ChainLogger(logger, {'chain': self.name}) if self.name else logger
+        self.decoder = Decoder(bech32_prefix=config['bech_32_prefix'], logger=self.logger)
+        self.metrics = IndexerMetrics(logger=self.logger, labels={'chain': self.name} if self.name else None)
+
+        self.exporter = None
+        export_config = config.get('export') or {}
+        if export_config.get('enabled'):
+            # Not namespaced, every chain of the process writes its rows to the same database
+            self.exporter = SqliteExport(
+                logger=self.logger,
+                chain=self.name or config['bech_32_prefix'],
+                path=export_config.get('path', 'validators.sqlite'),
+                history=export_config.get('history', False)
+            )
+
+        self.checkpoints = CheckpointStore(
+            logger=self.logger,
+            path=os.path.join(self.namespace, 'metrics.json'),
+            compact_every=config.get('checkpoint_compact_every', 50),
+            metrics=self.metrics,
+            exporter=self.exporter,
+            # The rolling windows are not in the log records, every checkpoint is a full snapshot while they are on
+            log=not (config.get('windows') or {}).get('enabled')
+        )
+
+        self.backfill_config = config.get('backfill') or {}
+        self.shards_path = self.backfill_config.get('path', 'shards')
+        self.backfill_plan_path = os.path.join(self.shards_path, 'plan.json')
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import os
+import time
+from utils.metrics import IndexerMetrics
+from utils.gaps import GapLedger
+
+class CheckpointStore:
+
+    def __init__(self, logger, path='metrics.json', compact_every=50, metrics=None, exporter=None, log=True):
+        self.logger = logger
+        self.metrics = metrics or IndexerMetrics(logger=logger)
+        self.exporter = exporter
+        self.path = path
+        self.log_path = f"{os.path.splitext(path)[0]}.log"
+        self.compact_every = compact_every
+        self.log = log
+        self.records = 0
+        self.validator_count = None
+        self.gaps = GapLedger()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        with open(self.path, 'r') as file:
+            metrics_data = json.load(file)
+
+        self.gaps = GapLedger(metrics_data.get('missing_ranges') or [])
+        if os.path.exists(self.log_path) and not self.log:
+            # Log records carry counter deltas only, state that lives in the snapshot alone would fall behind them
+            self.logger.info(f"Ignoring {self.log_path}, indexing continues from the snapshot at {metrics_data['latest_height']}")
+        if not self.log or not os.path.exists(self.log_path):
+            self.validator_count = len(metrics_data['validators'])
+            return metrics_data
+
+        validators = {validator['hex']: validator for validator in metrics_data['validators'] if validator.get('hex')}
+        with open(self.log_path, 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Only the last line can be cut short by a crash, everything before it was fsynced
+                    self.logger.warning(f"Ignoring incomplete record at the end of {self.log_path}")
+                    break
+
+                # Records already folded into the snapshot survive a crash between rename and truncate
+                if record['to'] <= metrics_data['latest_height']:
+                    continue
+                if record['from'] != metrics_data['latest_height']:
+                    self.logger.warning(f"Gap in {self.log_path} at height {metrics_data['latest_height']}, ignoring the rest of the log")
+                    break
+
+                for hex_address, (signed, missed, proposed) in record['deltas'].items():
+                    validator = validators.get(hex_address)
+                    if validator is not None:
+                        validator['total_signed_blocks'] += signed
+                        validator['total_missed_blocks'] += missed
+                        validator['total_proposed_blocks'] += proposed
+                metrics_data['latest_height'] = record['to']
+                if 'missing' in record:
+                    self.gaps = GapLedger(record['missing'])
+                self.records += 1
+
+        metrics_data['missing_ranges'] = self.gaps.ranges()
+        self.validator_count = len(metrics_data['validators'])
+        return metrics_data
+
+    async def save(self, start_height, end_height, deltas, validators, missing=None):
+        # Log records only carry deltas, a validator added since the last snapshot has to be written out in full
+        if not self.log or not self.exists() or self.records >= self.compact_every or len(validators) != self.validator_count:
+            await self.snapshot(latest_height=end_height, validators=validators, missing=missing)
+        else:
+            await self.append(start_height=start_height, end_height=end_height, deltas=deltas, missing=missing)
+            await self.export(latest_height=end_height, validators=validators, changed=deltas)
+
+    async def append(self, start_height, end_height, deltas, missing=None):
+        start_time = time.perf_counter()
+        missing = self.gaps.ranges() if missing is None else missing
+        record = json.dumps({'from': start_height, 'to': end_height, 'deltas': deltas, 'missing': missing})
+        await asyncio.to_thread(self.write_record, record)
+        self.records += 1
+        self.metrics.checkpoint_latency.observe(time.perf_counter() - start_time, kind='append')
+
+    async def snapshot(self, latest_height, validators, missing=None):
+        start_time = time.perf_counter()
+        self.validator_count = len(validators)
+        metrics_data = json.dumps({
+            'latest_height': latest_height,
+            'missing_ranges': self.gaps.ranges() if missing is None else missing,
+            'validators': validators
+        })
+        await asyncio.to_thread(self.write_snapshot, metrics_data)
+        self.records = 0
+        self.metrics.checkpoint_latency.observe(time.perf_counter() - start_time, kind='snapshot')
+        await self.export(latest_height=latest_height, validators=validators, snapshot=True)
+
+    async def export(self, latest_height, validators, changed=None, snapshot=False):
+        if self.exporter is None:
+            return
+        start_time = time.perf_counter()
+        # Between snapshots only the validators tallied by the checkpoint are written
+        await self.exporter.update(latest_height=latest_height, validators=validators, changed=changed, snapshot=snapshot)
+        self.metrics.checkpoint_latency.observe(time.perf_counter() - start_time, kind='export')
+
+    def write_record(self, record):
+        with open(self.log_path, 'a') as file:
+            file.write(record + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+    def write_snapshot(self, metrics_data):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as file:
+            file.write(metrics_data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
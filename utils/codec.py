@@ -0,0 +1,120 @@
+import json
+import sys
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if msgspec is not None:
+    BACKEND = 'msgspec'
+    loads = msgspec.json.decode
+
+    # Only the fields the tally reads are declared, msgspec skips everything else without building objects for it
+    class Signature(msgspec.Struct, gc=False):
+        validator_address: str | None = None
+
+    class Commit(msgspec.Struct):
+        signatures: list[Signature]
+
+    class Header(msgspec.Struct):
+        proposer_address: str
+        validators_hash: str | None = None
+
+    class SignedHeader(msgspec.Struct):
+        header: Header
+        commit: Commit
+
+    class CommitResult(msgspec.Struct):
+        signed_header: SignedHeader
+
+    class CommitResponse(msgspec.Struct):
+        result: CommitResult
+
+    class Validator(msgspec.Struct, gc=False):
+        address: str
+
+    class ValsetResult(msgspec.Struct):
+        validators: list[Validator]
+        total: int | str | None = None
+
+    class ValsetResponse(msgspec.Struct):
+        result: ValsetResult
+
+    class BatchItem(msgspec.Struct):
+        id: int | str | None = None
+        result: msgspec.Raw = msgspec.Raw()
+
+    commit_response_decoder = msgspec.json.Decoder(CommitResponse)
+    commit_result_decoder = msgspec.json.Decoder(CommitResult)
+    valset_response_decoder = msgspec.json.Decoder(ValsetResponse)
+    valset_result_decoder = msgspec.json.Decoder(ValsetResult)
+    batch_decoder = msgspec.json.Decoder(list[BatchItem])
+
+elif orjson is not None:
+    BACKEND = 'orjson'
+    loads = orjson.loads
+
+else:
+    BACKEND = 'json'
+    loads = json.loads
+
+def lean_commit(signatures, proposer, validators_hash):
+    # Interned addresses are shared across blocks, so set and dict lookups in the tally mostly compare by identity
+    return {
+        "signatures": [sys.intern(address) for address in signatures if address],
+        "proposer": sys.intern(proposer),
+        "validators_hash": validators_hash
+    }
+
+def commit_from_result(result):
+    if msgspec is not None and isinstance(result, msgspec.Raw):
+        result = commit_result_decoder.decode(result)
+    if msgspec is not None and isinstance(result, CommitResult):
+        header = result.signed_header.header
+        signatures = [signature.validator_address for signature in result.signed_header.commit.signatures]
+        return lean_commit(signatures, header.proposer_address, header.validators_hash)
+
+    header = result['signed_header']['header']
+    signatures = [signature['validator_address'] for signature in result['signed_header']['commit']['signatures']]
+    return lean_commit(signatures, header['proposer_address'], header.get('validators_hash'))
+
+def valset_total(total):
+    return int(total) if total is not None else None
+
+def valset_from_result(result):
+    # A page comes with the size of the whole set, which tells how many pages there are
+    if msgspec is not None and isinstance(result, msgspec.Raw):
+        result = valset_result_decoder.decode(result)
+    if msgspec is not None and isinstance(result, ValsetResult):
+        return [sys.intern(validator.address) for validator in result.validators], valset_total(result.total)
+
+    return [sys.intern(validator['address']) for validator in result['validators']], valset_total(result.get('total'))
+
+def decode_commit(data):
+    if msgspec is not None:
+        return commit_from_result(commit_response_decoder.decode(data).result)
+    return commit_from_result(loads(data)['result'])
+
+def decode_valset(data):
+    if msgspec is not None:
+        return valset_from_result(valset_response_decoder.decode(data).result)
+    return valset_from_result(loads(data)['result'])
+
+def decode_batch(data):
+    if msgspec is not None:
+        try:
+            # Errored calls carry no result or a bare null, both come back as None and fall back to a single request
+            return {item.id: item.result if len(item.result) > 4 else None for item in batch_decoder.decode(data)}
+        except msgspec.ValidationError:
+            # Nodes that refuse batches answer with a single error object
+            return None
+
+    data = loads(data)
+    if isinstance(data, list):
+        return {item.get('id'): item.get('result') for item in data if isinstance(item, dict)}
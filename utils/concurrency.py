@@ -0,0 +1,86 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+def jittered_backoff(attempt, base=0.5, cap=30):
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class AdaptiveLimiter:
+
+    def __init__(
+                 self,
+                 logger,
+                 initial = 10,
+                 minimum = 1,
+                 maximum = 300,
+                 latency_tolerance = 2.0
+                 ):
+
+        self.logger = logger
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.waiters = deque()
+        self.latency = None
+        self.baselines = {}
+        self.last_decrease = 0
+        self.slow_start = True
+
+    async def acquire(self):
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                self.wake()
+                raise
+        self.in_flight += 1
+
+    def release(self, latency, congested=False, kind=None):
+        self.in_flight -= 1
+        if congested:
+            self.decrease(factor=0.5)
+        else:
+            self.observe(latency, kind)
+        self.wake()
+
+    def wake(self):
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def observe(self, latency, kind=None):
+        self.latency = latency if self.latency is None else 0.9 * self.latency + 0.1 * latency
+
+        # Latency is judged per request kind, a slow block_search must not make /commit look congested
+        average, baseline = self.baselines.get(kind, (latency, latency))
+        average = 0.9 * average + 0.1 * latency
+        # The baseline slowly forgets old minimums so a node that got slower for good is not punished forever
+        baseline = min(baseline * 1.001, average)
+        self.baselines[kind] = (average, baseline)
+
+        if average <= baseline * self.latency_tolerance:
+            # Slow start doubles the limit every round trip until the first sign of trouble
+            step = 1 if self.slow_start else 1 / self.limit
+            self.limit = min(self.maximum, self.limit + step)
+        else:
+            self.decrease(factor=0.9)
+
+    def decrease(self, factor):
+        now = time.monotonic()
+        # One backoff per round trip, a burst of failures from the same window counts once
+        if now - self.last_decrease < max(self.latency or 0, 0.5):
+            return
+        self.last_decrease = now
+        self.slow_start = False
+        self.limit = max(self.minimum, self.limit * factor)
+        self.logger.debug(f"Concurrency limit lowered to {int(self.limit)} (in flight: {self.in_flight})")
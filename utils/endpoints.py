@@ -0,0 +1,65 @@
+from utils.concurrency import AdaptiveLimiter
+
+class Endpoint:
+
+    def __init__(self, url, limiter):
+        self.url = url.rstrip('/')
+        self.limiter = limiter
+        self.latency = None
+        self.failures = 0
+        self.healthy = True
+        self.lowest_height = None
+
+    def serves(self, height):
+        return height is None or self.lowest_height is None or height >= self.lowest_height
+
+    def score(self):
+        latency = self.latency if self.latency is not None else 0.1
+        return latency * (self.limiter.in_flight + 1) / self.limiter.limit
+
+    def record(self, latency, ok):
+        if ok:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            self.failures = 0
+            self.healthy = True
+        else:
+            self.failures += 1
+            if self.failures >= 3:
+                self.healthy = False
+
+class EndpointPool:
+
+    def __init__(self, urls, config, logger):
+        if isinstance(urls, str):
+            urls = [urls]
+
+        self.logger = logger
+        self.endpoints = []
+        for url in urls:
+            limiter = AdaptiveLimiter(
+                logger=logger,
+                initial=config.get('initial_concurrency', 10),
+                maximum=config.get('max_concurrency', 300)
+            )
+            self.endpoints.append(Endpoint(url=url, limiter=limiter))
+
+    def __iter__(self):
+        return iter(self.endpoints)
+
+    def pick(self, height=None, exclude=None, refused=()):
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.serves(height)]
+        if not candidates:
+            self.logger.debug(f"No endpoint serves height {height}, trying the one with the lowest floor")
+            candidates = [min(self.endpoints, key=lambda endpoint: endpoint.lowest_height)]
+
+        # Endpoints that refused the request are not asked again, None once all of them did
+        candidates = [endpoint for endpoint in candidates if endpoint not in refused]
+        if not candidates:
+            return None
+
+        healthy = [endpoint for endpoint in candidates if endpoint.healthy and endpoint is not exclude]
+        return min(healthy or candidates, key=lambda endpoint: endpoint.score())
+
+    def lowest_height(self):
+        heights = [endpoint.lowest_height for endpoint in self.endpoints if endpoint.lowest_height is not None]
+        return min(heights) if heights else None
@@ -0,0 +1,95 @@
+import asyncio
+import sqlite3
+import time
+
+# Typed columns of the validators table, in the order they are written
+VALIDATOR_COLUMNS = {
+    'valoper': 'TEXT',
+    'valcons': 'TEXT',
+    'wallet': 'TEXT',
+    'moniker': 'TEXT',
+    'commission': 'REAL',
+    'total_signed_blocks': 'INTEGER',
+    'total_missed_blocks': 'INTEGER',
+    'total_proposed_blocks': 'INTEGER',
+    'delegators_count': 'INTEGER',
+    'tombstoned': 'INTEGER',
+    'window_blocks': 'INTEGER',
+    'window_missed_blocks': 'INTEGER',
+    'missed_blocks_streak': 'INTEGER',
+    'longest_missed_blocks_streak': 'INTEGER',
+    'window_proposed_blocks': 'INTEGER'
+}
+
+class SqliteExport:
+
+    def __init__(self, logger, chain, path='validators.sqlite', history=False):
+        self.logger = logger
+        self.chain = chain
+        self.path = path
+        self.history = history
+        self.synced = False
+        # Checkpoint writes run in worker threads, one at a time per store
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.create_tables()
+
+    def create_tables(self):
+        columns = ', '.join(f"{name} {kind}" for name, kind in VALIDATOR_COLUMNS.items())
+        with self.connection:
+            # Dashboards read while the indexer writes, WAL keeps them from blocking each other
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS validators (chain TEXT NOT NULL, hex TEXT NOT NULL, validator_index INTEGER, {columns}, updated_height INTEGER, PRIMARY KEY (chain, hex))")
+            existing = {row[1] for row in self.connection.execute("PRAGMA table_info(validators)")}
+            for name, kind in VALIDATOR_COLUMNS.items():
+                if name not in existing:
+                    self.connection.execute(f"ALTER TABLE validators ADD COLUMN {name} {kind}")
+            for name in ('valoper', 'hex', 'valcons'):
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS validators_{name} ON validators ({name})")
+
+            self.connection.execute("CREATE TABLE IF NOT EXISTS slashes (chain TEXT NOT NULL, hex TEXT NOT NULL, height INTEGER NOT NULL, time TEXT, PRIMARY KEY (chain, hex, height))")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS chains (chain TEXT PRIMARY KEY, latest_height INTEGER, updated_at REAL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS history (chain TEXT NOT NULL, height INTEGER NOT NULL, hex TEXT NOT NULL, total_signed_blocks INTEGER, total_missed_blocks INTEGER, total_proposed_blocks INTEGER, window_missed_blocks INTEGER, PRIMARY KEY (chain, height, hex))")
+
+    def validator_row(self, validator, latest_height):
+        return (self.chain, validator['hex'], validator.get('index'), *[validator.get(name) for name in VALIDATOR_COLUMNS], latest_height)
+
+    async def update(self, latest_height, validators, changed=None, snapshot=False):
+        # Rows are built on the event loop while the validator records are not being tallied
+        if not self.synced:
+            changed = None
+        validator_rows = [
+            self.validator_row(validator, latest_height) for validator in validators
+            if validator.get('hex') and (changed is None or validator['hex'] in changed)
+        ]
+
+        slash_rows = []
+        history_rows = []
+        if snapshot or changed is None:
+            for validator in validators:
+                for slash in (validator.get('slashing_info') or []) if validator.get('hex') else []:
+                    slash_rows.append((self.chain, validator['hex'], int(slash['height']), slash.get('time')))
+        if snapshot and self.history:
+            for validator in validators:
+                if validator.get('hex'):
+                    history_rows.append((self.chain, latest_height, validator['hex'], validator['total_signed_blocks'], validator['total_missed_blocks'], validator['total_proposed_blocks'], validator.get('window_missed_blocks')))
+
+        try:
+            await asyncio.to_thread(self.write, latest_height, validator_rows, slash_rows, history_rows)
+            self.synced = True
+        except sqlite3.Error as e:
+            self.logger.warning(f"Failed to export validators to {self.path}: {e}")
+
+    def write(self, latest_height, validator_rows, slash_rows, history_rows):
+        names = ['chain', 'hex', 'validator_index', *VALIDATOR_COLUMNS, 'updated_height']
+        updates = ', '.join(f"{name} = excluded.{name}" for name in names[2:])
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT INTO validators ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) ON CONFLICT (chain, hex) DO UPDATE SET {updates}",
+                validator_rows
+            )
+            self.connection.executemany("INSERT OR IGNORE INTO slashes VALUES (?, ?, ?, ?)", slash_rows)
+            self.connection.executemany("INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?, ?, ?, ?)", history_rows)
+            self.connection.execute("INSERT OR REPLACE INTO chains VALUES (?, ?, ?)", (self.chain, latest_height, time.time()))
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,134 @@
+import asyncio
+from bisect import bisect_left, bisect_right
+from utils.concurrency import jittered_backoff
+
+class GapLedger:
+
+    def __init__(self, ranges=()):
+        # Sorted, disjoint [start, end) ranges of heights below the checkpoint that are not counted yet
+        self.starts = []
+        self.ends = []
+        for start, end in ranges:
+            self.add_range(start, end)
+
+    def add(self, height):
+        self.add_range(height, height + 1)
+
+    def add_range(self, start, end):
+        # Every range that overlaps or touches the new one is merged into it
+        first = bisect_left(self.ends, start)
+        last = bisect_right(self.starts, end)
+        if first < last:
+            start = min(start, self.starts[first])
+            end = max(end, self.ends[last - 1])
+        self.starts[first:last] = [start]
+        self.ends[first:last] = [end]
+
+    def remove(self, height):
+        index = bisect_right(self.starts, height) - 1
+        if index < 0 or height >= self.ends[index]:
+            return False
+
+        pieces = [(start, end) for start, end in ((self.starts[index], height), (height + 1, self.ends[index])) if start < end]
+        self.starts[index:index + 1] = [start for start, _ in pieces]
+        self.ends[index:index + 1] = [end for _, end in pieces]
+        return True
+
+    def __contains__(self, height):
+        index = bisect_right(self.starts, height) - 1
+        return index >= 0 and height < self.ends[index]
+
+    def __len__(self):
+        return sum(end - start for start, end in zip(self.starts, self.ends))
+
+    def __iter__(self):
+        for start, end in zip(self.starts, self.ends):
+            yield from range(start, end)
+
+    def ranges(self):
+        return [[start, end] for start, end in zip(self.starts, self.ends)]
+
+    def describe(self):
+        return ', '.join(f"[{start}, {end})" for start, end in zip(self.starts, self.ends))
+
+class GapScheduler:
+
+    def __init__(self, ledger, fetch, logger, max_attempts=8, concurrency=4):
+        self.ledger = ledger
+        self.fetch = fetch
+        self.logger = logger
+        self.max_attempts = max_attempts
+        self.concurrency = concurrency
+        # Ranges waiting for their next attempt as [start, end, attempt, due time]
+        self.ranges = []
+        self.fetched = {}
+        self.task = None
+
+    def schedule(self, start, end=None):
+        end = start + 1 if end is None else end
+        due = asyncio.get_running_loop().time() + jittered_backoff(1, base=1, cap=60)
+        # Heights failing one after another join the range that has not been tried yet
+        if self.ranges and self.ranges[-1][2] == 1 and self.ranges[-1][1] == start:
+            self.ranges[-1][1] = end
+        else:
+            self.ranges.append([start, end, 1, due])
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def schedule_ledger(self):
+        for start, end in self.ledger.ranges():
+            self.schedule(start, end)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while self.ranges:
+            now = loop.time()
+            due = [item for item in self.ranges if item[3] <= now]
+            if not due:
+                await asyncio.sleep(min(min(item[3] for item in self.ranges) - now, 1))
+                continue
+            self.ranges = [item for item in self.ranges if item[3] > now]
+            await self.retry(due)
+
+    async def retry(self, due):
+        # A fixed pool of workers walks the due ranges, a long gap never turns into a task per height
+        heights = ((height, attempt) for start, end, attempt, _ in due for height in range(start, end) if height in self.ledger)
+        failed = {}
+
+        async def worker():
+            for height, attempt in heights:
+                # Each attempt goes through the endpoint pool again, a node that pruned the height is not picked
+                block, valset = await self.fetch(height)
+                if block is None or valset is None:
+                    failed.setdefault(attempt, GapLedger()).add(height)
+                else:
+                    self.fetched[height] = (block, valset)
+
+        await asyncio.gather(*[worker() for _ in range(self.concurrency)])
+
+        now = asyncio.get_running_loop().time()
+        for attempt, ledger in failed.items():
+            if attempt >= self.max_attempts:
+                self.logger.warning(f"Heights {ledger.describe()} still fail after {attempt} retries, they are left in the missing ranges")
+                continue
+            for start, end in ledger.ranges():
+                self.ranges.append([start, end, attempt + 1, now + jittered_backoff(attempt + 1, base=1, cap=60)])
+
+    def take(self):
+        # Recovered blocks are handed over when the caller flushes, so the counters and the missing ranges are saved together
+        fetched, self.fetched = self.fetched, {}
+        blocks = []
+        for height in sorted(fetched):
+            # A height scheduled twice is only counted once
+            if self.ledger.remove(height):
+                blocks.append(fetched[height])
+        return blocks
+
+    async def drain(self):
+        while self.task is not None and not self.task.done():
+            await self.task
+
+    def cancel(self):
+        self.ranges = []
+        if self.task is not None:
+            self.task.cancel()
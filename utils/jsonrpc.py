@@ -0,0 +1,38 @@
+import asyncio
+
+class JsonRpcBatcher:
+
+    def __init__(self, send, width, linger=0.005):
+        self.send = send
+        self.width = width
+        self.linger = linger
+        self.queue = []
+        self.timer = None
+
+    async def call(self, method, params):
+        future = asyncio.get_running_loop().create_future()
+        self.queue.append((method, params, future))
+
+        if len(self.queue) >= self.width:
+            self.flush()
+        elif self.timer is None:
+            # Calls made in the same tick, or within the linger, share one POST
+            self.timer = asyncio.get_running_loop().call_later(self.linger, self.flush)
+
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        calls, self.queue = self.queue, []
+        if calls:
+            asyncio.ensure_future(self.dispatch(calls))
+
+    async def dispatch(self, calls):
+        results = await self.send([(method, params) for method, params, _ in calls])
+
+        for (_, _, future), result in zip(calls, results):
+            if not future.done():
+                future.set_result(result)
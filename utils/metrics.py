@@ -0,0 +1,190 @@
+import bisect
+from aiohttp import web
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values)) + '}'
+
+class Metric:
+
+    def __init__(self, name, description, kind, labels=()):
+        self.name = name
+        self.description = description
+        self.kind = kind
+        self.labels = tuple(labels)
+        self.constant = {}
+        self.values = {}
+
+    def key(self, labels):
+        return tuple(labels[name] for name in self.labels)
+
+    def format_labels(self, key, names=(), values=()):
+        return format_labels((*self.constant, *self.labels, *names), (*self.constant.values(), *key, *values))
+
+    def header(self):
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self):
+        return [f"{self.name}{self.format_labels(key)} {value}" for key, value in self.values.items()]
+
+    def render(self):
+        return self.header() + self.samples()
+
+class Counter(Metric):
+
+    def __init__(self, name, description, labels=()):
+        super().__init__(name, description, 'counter', labels)
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+
+    def __init__(self, name, description, labels=()):
+        super().__init__(name, description, 'gauge', labels)
+
+    def set(self, value, **labels):
+        self.values[self.key(labels)] = value
+
+class Histogram(Metric):
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, description, 'histogram', labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        series = self.values.get(key)
+        if series is None:
+            # Bucket counts are kept per bucket and summed up on render, the last slot is +Inf
+            series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self):
+        lines = []
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket
+                lines.append(f"{self.name}_bucket{self.format_labels(key, ('le',), (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{self.format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{self.format_labels(key)} {count}")
+        return lines
+
+def render(registries):
+    # A family is written once with the samples of every registry, repeating HELP and TYPE is invalid exposition
+    lines = []
+    for family in zip(*[registry.families() for registry in registries]):
+        lines.extend(family[0].header())
+        for metric in family:
+            lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+class IndexerMetrics:
+
+    def __init__(self, logger, labels=None):
+        self.logger = logger
+        self.labels = labels or {}
+        self.pools = {}
+        self.validators = []
+
+        self.requests = Counter('indexer_requests_total', 'HTTP requests by endpoint type and outcome', ['kind', 'outcome'])
+        self.request_latency = Histogram('indexer_request_duration_seconds', 'HTTP request latency by endpoint type', ['kind'])
+        self.retries = Counter('indexer_request_retries_total', 'Requests retried after a failed attempt', ['kind'])
+        self.failures = Counter('indexer_request_failures_total', 'Requests given up after all retries', ['kind'])
+        self.blocks = Counter('indexer_blocks_indexed_total', 'Blocks tallied by this process')
+        self.blocks_per_second = Gauge('indexer_blocks_per_second', 'Indexing rate over the last checkpoint batch')
+        self.indexed_height = Gauge('indexer_indexed_height', 'Next height to be indexed')
+        self.head_height = Gauge('indexer_chain_head_height', 'Latest chain height seen on the RPC')
+        self.head_lag = Gauge('indexer_head_lag_blocks', 'Blocks between the chain head and the indexed height')
+        self.missing_heights = Gauge('indexer_missing_heights', 'Heights below the indexed height that failed and are not counted yet')
+        self.checkpoint_latency = Histogram('indexer_checkpoint_write_seconds', 'Time to write a checkpoint', ['kind'])
+        self.tally_cpu = Histogram('indexer_tally_cpu_seconds', 'CPU time spent tallying one checkpoint batch', buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+
+        self.metrics = [
+            self.requests, self.request_latency, self.retries, self.failures, self.blocks, self.blocks_per_second,
+            self.indexed_height, self.head_height, self.head_lag, self.missing_heights, self.checkpoint_latency, self.tally_cpu
+        ]
+        for metric in self.metrics:
+            metric.constant = self.labels
+
+    def progress(self, indexed_height=None, head_height=None):
+        if indexed_height is not None:
+            self.indexed_height.set(indexed_height)
+        if head_height is not None:
+            self.head_height.set(head_height)
+        if self.head_height.values and self.indexed_height.values:
+            self.head_lag.set(max(0, self.head_height.values[()] - self.indexed_height.values[()]))
+
+    def collect(self):
+        # Endpoint state and validator counters already live elsewhere, they are read at scrape time
+        in_flight = Gauge('indexer_requests_in_flight', 'Requests currently in flight per endpoint', ['pool', 'endpoint'])
+        limit = Gauge('indexer_concurrency_limit', 'Adaptive concurrency limit per endpoint', ['pool', 'endpoint'])
+        healthy = Gauge('indexer_endpoint_healthy', 'Whether the endpoint passed its last health check', ['pool', 'endpoint'])
+        for pool_name, pool in self.pools.items():
+            for endpoint in pool:
+                in_flight.set(endpoint.limiter.in_flight, pool=pool_name, endpoint=endpoint.url)
+                limit.set(int(endpoint.limiter.limit), pool=pool_name, endpoint=endpoint.url)
+                healthy.set(int(endpoint.healthy), pool=pool_name, endpoint=endpoint.url)
+
+        labels = ['moniker', 'valoper', 'hex']
+        signed = Gauge('indexer_validator_signed_blocks', 'Blocks signed by the validator', labels)
+        missed = Gauge('indexer_validator_missed_blocks', 'Blocks missed by the validator', labels)
+        proposed = Gauge('indexer_validator_proposed_blocks', 'Blocks proposed by the validator', labels)
+        window_missed = Gauge('indexer_validator_window_missed_blocks', 'Blocks missed within the signed blocks window', labels)
+        streak = Gauge('indexer_validator_missed_blocks_streak', 'Consecutive blocks missed up to the indexed height', labels)
+        window_proposed = Gauge('indexer_validator_window_proposed_blocks', 'Blocks proposed within the proposals window', labels)
+        for validator in self.validators:
+            if not validator.get('hex'):
+                continue
+            names = {'moniker': validator.get('moniker') or '', 'valoper': validator.get('valoper') or '', 'hex': validator['hex']}
+            signed.set(validator['total_signed_blocks'], **names)
+            missed.set(validator['total_missed_blocks'], **names)
+            proposed.set(validator['total_proposed_blocks'], **names)
+            if 'window_missed_blocks' in validator:
+                window_missed.set(validator['window_missed_blocks'], **names)
+                streak.set(validator['missed_blocks_streak'], **names)
+                window_proposed.set(validator['window_proposed_blocks'], **names)
+
+        collected = [in_flight, limit, healthy, signed, missed, proposed, window_missed, streak, window_proposed]
+        for metric in collected:
+            metric.constant = self.labels
+        return collected
+
+    def families(self):
+        return [*self.metrics, *self.collect()]
+
+    def render(self):
+        return render([self])
+
+class MetricsServer:
+
+    def __init__(self, logger, registries):
+        self.logger = logger
+        self.registries = registries
+        self.runner = None
+
+    async def handle(self, request):
+        return web.Response(body=render(self.registries).encode(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    async def start(self, host='0.0.0.0', port=9100):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        self.logger.info(f"Serving Prometheus metrics on http://{host}:{port}/metrics")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
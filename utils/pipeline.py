@@ -0,0 +1,30 @@
+import asyncio
+
+async def fetch_ordered(fetch, start_height, end_height, window):
+    heights = iter(range(start_height, end_height))
+    pending = {}
+    buffer = {}
+    next_height = start_height
+
+    def refill():
+        while len(pending) + len(buffer) < window:
+            height = next(heights, None)
+            if height is None:
+                return
+            pending[asyncio.ensure_future(fetch(height))] = height
+
+    try:
+        refill()
+        while next_height < end_height:
+            if next_height in buffer:
+                yield next_height, buffer.pop(next_height)
+                next_height += 1
+                refill()
+                continue
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                buffer[pending.pop(task)] = task.result()
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+def describe_validator(validator, decoder, index):
+    validator['wallet'] = decoder.convert_valoper_to_account(valoper=validator['valoper'])
+    validator['valcons'] = decoder.convert_consenses_pubkey_to_valcons(consensus_pub_key=validator['consensus_pubkey'])
+    validator['hex'] = decoder.conver_valcons_to_hex(valcons=validator['valcons'])
+    validator['total_signed_blocks'] = 0
+    validator['total_missed_blocks'] = 0
+    validator['total_proposed_blocks'] = 0
+    validator['index'] = index
+    return validator
+
+class ValidatorRegistry:
+
+    def __init__(self, validators, session, decoder, logger, retry_interval=600):
+        self.validators = validators
+        self.session = session
+        self.decoder = decoder
+        self.logger = logger
+        self.retry_interval = retry_interval
+        self.by_hex = {validator['hex']: validator for validator in validators if validator.get('hex')}
+        self.unresolved = {}
+        self.lookup = None
+
+    def unknown(self, valset):
+        now = time.monotonic()
+        return [
+            hex_address for hex_address in valset
+            if hex_address not in self.by_hex and now - self.unresolved.get(hex_address, -self.retry_interval) >= self.retry_interval
+        ]
+
+    async def resolve(self, valset, height):
+        unknown = self.unknown(valset)
+        if not unknown:
+            return
+
+        # One staking query answers every unknown address, concurrent valsets wait for the same one
+        if self.lookup is None:
+            self.lookup = asyncio.ensure_future(self.refresh())
+            self.lookup.add_done_callback(lambda _: setattr(self, 'lookup', None))
+        await asyncio.shield(self.lookup)
+
+        for hex_address in unknown:
+            if hex_address not in self.by_hex:
+                self.unresolved[hex_address] = time.monotonic()
+                self.logger.debug(f"Validator {hex_address} at height {height} is not known to the staking API, it is not counted")
+
+    async def refresh(self):
+        staking_validators = await self.session.get_validators(status=None)
+        if not staking_validators:
+            return
+
+        for validator in staking_validators:
+            hex_address = self.decoder.conver_valcons_to_hex(valcons=self.decoder.convert_consenses_pubkey_to_valcons(consensus_pub_key=validator['consensus_pubkey']))
+            if hex_address and hex_address not in self.by_hex:
+                validator = describe_validator(validator, self.decoder, index=len(self.validators) + 1)
+                self.validators.append(validator)
+                self.by_hex[hex_address] = validator
+                self.logger.info(f"New validator {validator['moniker']} ({validator['valoper']}) registered, it is counted from the next set it appears in")
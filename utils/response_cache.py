@@ -0,0 +1,295 @@
+import asyncio
+import os
+import struct
+import sys
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+class ResponseCache:
+
+    def __init__(self, logger, path='cache', chunk_heights=1000, max_size_mb=2048, replay=False, max_chunks=8, max_valsets=256):
+        self.logger = logger
+        self.path = path
+        self.valsets_path = os.path.join(path, 'valsets')
+        self.chunk_heights = chunk_heights
+        self.max_size = max_size_mb * 1024 * 1024
+        self.replay = replay
+        self.max_chunks = max_chunks
+        self.max_valsets = max_valsets
+        os.makedirs(self.valsets_path, exist_ok=True)
+
+        self.chunks = OrderedDict()
+        self.dirty = set()
+        self.valsets = OrderedDict()
+        self.writes = set()
+        self.write_lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.size = sum(os.path.getsize(file_path) for file_path, _ in self.cached_files())
+
+    def cached_files(self):
+        files = []
+        for directory, prefix in ((self.path, 'chunk_'), (self.valsets_path, '')):
+            for name in os.listdir(directory):
+                if name.startswith(prefix) and name.endswith('.bin'):
+                    files.append((os.path.join(directory, name), prefix == 'chunk_'))
+        return files
+
+    def chunk_path(self, number):
+        return os.path.join(self.path, f"chunk_{number:08d}.bin")
+
+    @contextmanager
+    def locked(self):
+        # Backfill workers share the cache, a chunk is re-read and merged under the lock before it is replaced
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.path, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def load_chunk(self, chunk, chunk_path):
+        try:
+            with open(chunk_path, 'rb') as file:
+                self.read_chunk(chunk, zlib.decompress(file.read()))
+        except (OSError, zlib.error, struct.error) as e:
+            self.logger.debug(f"Ignoring unreadable cache chunk {chunk_path}: {e}")
+
+    def chunk(self, number):
+        chunk = self.chunks.get(number)
+        if chunk is not None:
+            self.chunks.move_to_end(number)
+            return chunk
+
+        chunk = {}
+        chunk_path = self.chunk_path(number)
+        if os.path.exists(chunk_path):
+            self.load_chunk(chunk, chunk_path)
+            # Evicting by modification time keeps the chunks that are still being read
+            os.utime(chunk_path)
+
+        self.chunks[number] = chunk
+        while len(self.chunks) > self.max_chunks:
+            evicted, records = self.chunks.popitem(last=False)
+            if evicted in self.dirty:
+                self.write_later(evicted, records)
+        return chunk
+
+    def read_chunk(self, chunk, data):
+        # Record: height, hash size, validators hash, proposer, signature count, 20 byte signer addresses
+        offset = 0
+        while offset < len(data):
+            height, hash_size = struct.unpack_from('<QB', data, offset)
+            count, = struct.unpack_from('<H', data, offset + 29 + hash_size)
+            end = offset + 31 + hash_size + 20 * count
+            chunk[height] = data[offset + 8:end]
+            offset = end
+
+    def write_later(self, number, chunk):
+        # Compressing a chunk and waiting for the lock shared with backfill workers happen off the event loop
+        self.dirty.discard(number)
+        task = asyncio.ensure_future(self.write_chunk(number, dict(chunk)))
+        self.writes.add(task)
+        task.add_done_callback(self.writes.discard)
+
+    async def write_chunk(self, number, chunk):
+        async with self.write_lock:
+            try:
+                size, old_size = await asyncio.to_thread(self.merge_chunk, chunk, self.chunk_path(number))
+            except OSError as e:
+                self.logger.warning(f"Failed to write cache chunk {self.chunk_path(number)}: {e}")
+                return
+            self.size += size - old_size
+            await self.evict()
+
+    def merge_chunk(self, chunk, chunk_path):
+        with self.locked():
+            old_size = 0
+            if os.path.exists(chunk_path):
+                old_size = os.path.getsize(chunk_path)
+                on_disk = {}
+                self.load_chunk(on_disk, chunk_path)
+                for height, record in on_disk.items():
+                    chunk.setdefault(height, record)
+            self.write_records(chunk, chunk_path)
+            return os.path.getsize(chunk_path), old_size
+
+    def write_records(self, chunk, chunk_path):
+        records = []
+        for height, record in sorted(chunk.items()):
+            records.append(struct.pack('<Q', height) + record)
+        # Addresses repeat from block to block, compressing the whole chunk catches that
+        data = zlib.compress(b''.join(records), 6)
+
+        temp_path = f"{chunk_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, chunk_path)
+
+    async def evict(self):
+        if self.size <= self.max_size:
+            return
+
+        freed, removed = await asyncio.to_thread(self.remove_oldest, self.size - self.max_size)
+        self.size -= freed
+        for file_path, is_chunk in removed:
+            if is_chunk:
+                number = int(os.path.basename(file_path)[6:14])
+                self.chunks.pop(number, None)
+                self.dirty.discard(number)
+            else:
+                self.valsets.pop(file_path, None)
+            self.logger.debug(f"Evicted {file_path} from the response cache")
+
+    def remove_oldest(self, excess):
+        # Chunks and validator sets are evicted together, oldest modification time first
+        files = []
+        for file_path, is_chunk in self.cached_files():
+            try:
+                files.append((os.path.getmtime(file_path), os.path.getsize(file_path), file_path, is_chunk))
+            except OSError:
+                continue
+        files.sort()
+
+        freed = 0
+        removed = []
+        for _, size, file_path, is_chunk in files:
+            if freed >= excess:
+                break
+            try:
+                os.remove(file_path)
+            except OSError:
+                continue
+            freed += size
+            removed.append((file_path, is_chunk))
+        return freed, removed
+
+    def get_commit(self, height):
+        record = self.chunk(height // self.chunk_heights).get(height)
+        if record is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        hash_size = record[0]
+        count, = struct.unpack_from('<H', record, 21 + hash_size)
+        signatures = [sys.intern(record[offset:offset + 20].hex().upper()) for offset in range(23 + hash_size, 23 + hash_size + 20 * count, 20)]
+        return {
+            "height": height,
+            "signatures": signatures,
+            "proposer": sys.intern(record[1 + hash_size:21 + hash_size].hex().upper()),
+            "validators_hash": record[1:1 + hash_size].hex().upper() or None
+        }
+
+    def put_commit(self, block):
+        try:
+            validators_hash = bytes.fromhex(block['validators_hash'] or '')
+            proposer = bytes.fromhex(block['proposer'])
+            signatures = b''.join(bytes.fromhex(address) for address in block['signatures'])
+        except ValueError:
+            return
+        if len(proposer) != 20 or len(signatures) != 20 * len(block['signatures']):
+            return
+
+        number = block['height'] // self.chunk_heights
+        chunk = self.chunk(number)
+        chunk[block['height']] = bytes([len(validators_hash)]) + validators_hash + proposer + struct.pack('<H', len(block['signatures'])) + signatures
+        self.dirty.add(number)
+        if len(chunk) >= self.chunk_heights:
+            self.write_later(number, chunk)
+
+    def valset_path(self, height, page):
+        # Sets are addressed by the validators hash of the cached commit, every height of an unchanged set shares one file
+        record = self.chunk(height // self.chunk_heights).get(height)
+        if record is None or not record[0]:
+            return None
+        return os.path.join(self.valsets_path, f"{record[1:1 + record[0]].hex().upper()}_{page}.bin")
+
+    def get_valset_page(self, height, page):
+        valset_path = self.valset_path(height, page)
+        if valset_path is None:
+            return None
+
+        page_data = self.valsets.get(valset_path)
+        if page_data is not None:
+            self.valsets.move_to_end(valset_path)
+            return page_data
+
+        try:
+            with open(valset_path, 'rb') as file:
+                data = zlib.decompress(file.read())
+        except OSError:
+            return None
+        except zlib.error:
+            data = b''
+        # Size of the whole set, then the addresses of the page
+        if len(data) < 4 or (len(data) - 4) % 20:
+            # Unreadable pages are dropped so the next fetch writes them again
+            self.remove_valset_page(valset_path)
+            return None
+
+        # Sets still in use are kept over older ones when the cache is evicted
+        os.utime(valset_path)
+        total, = struct.unpack_from('<I', data)
+        valset = [sys.intern(data[offset:offset + 20].hex().upper()) for offset in range(4, len(data), 20)]
+        self.remember_valset_page(valset_path, (valset, total))
+        return valset, total
+
+    def remember_valset_page(self, valset_path, page_data):
+        # Only the sets in use are kept in memory, a chain with frequent power changes has a new hash at most heights
+        self.valsets[valset_path] = page_data
+        self.valsets.move_to_end(valset_path)
+        while len(self.valsets) > self.max_valsets:
+            self.valsets.popitem(last=False)
+
+    def remove_valset_page(self, valset_path):
+        try:
+            size = os.path.getsize(valset_path)
+            os.remove(valset_path)
+        except OSError:
+            return
+        self.size -= size
+
+    def put_valset_page(self, height, page, valset, total):
+        valset_path = self.valset_path(height, page)
+        if valset_path is None or os.path.exists(valset_path):
+            return
+        try:
+            data = b''.join(bytes.fromhex(address) for address in valset)
+        except ValueError:
+            return
+        if len(data) != 20 * len(valset) or total is None:
+            return
+        data = zlib.compress(struct.pack('<I', total) + data)
+
+        temp_path = f"{valset_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, valset_path)
+        self.remember_valset_page(valset_path, (valset, total))
+        self.size += len(data)
+
+    def heights(self):
+        numbers = sorted(int(name[6:14]) for name in os.listdir(self.path) if name.startswith('chunk_') and name.endswith('.bin'))
+        if not numbers:
+            return None, None
+
+        lowest = min(self.chunk(numbers[0]), default=None)
+        latest = max(self.chunk(numbers[-1]), default=None)
+        return lowest, latest
+
+    async def close(self):
+        for number in list(self.dirty):
+            self.write_later(number, self.chunks[number])
+        while self.writes:
+            await asyncio.gather(*self.writes)
+        self.logger.debug(f"Response cache: {self.hits} hits, {self.misses} misses")
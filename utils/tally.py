@@ -0,0 +1,77 @@
+from collections import Counter
+
+class Tally:
+
+    def __init__(self, validators, windows=None):
+        self.validators = validators
+        self.windows = windows
+        self.positions = {}
+        self.registered = 0
+        self.active_sets = {}
+        self.register()
+        self.reset()
+
+    def register(self):
+        # Validators discovered mid-run are appended to the shared list, cached sets may be missing them
+        for position in range(self.registered, len(self.validators)):
+            if self.validators[position].get('hex'):
+                self.positions[self.validators[position]['hex']] = position
+        self.registered = len(self.validators)
+        self.active_sets.clear()
+
+    def reset(self):
+        self.signed = Counter()
+        self.proposed = Counter()
+        self.active_blocks = Counter()
+
+    def resolve_valset(self, valset):
+        active = self.active_sets.get(valset)
+        if active is None:
+            if len(self.active_sets) > 1024:
+                self.active_sets.clear()
+            active = frozenset(self.positions[address] for address in valset if address in self.positions)
+            self.active_sets[valset] = active
+        return active
+
+    def add_block(self, block, valset, windows=True):
+        if len(self.validators) != self.registered:
+            self.register()
+        active = self.resolve_valset(valset)
+        self.active_blocks[active] += 1
+
+        for address in block['signatures']:
+            position = self.positions.get(address)
+            if position is not None and position in active:
+                self.signed[position] += 1
+
+        proposer = self.positions.get(block['proposer'])
+        if proposer is not None and proposer in active:
+            self.proposed[proposer] += 1
+        else:
+            proposer = None
+
+        if self.windows is not None and windows:
+            # Windows only look up positions of the active set, signers outside it are harmless here
+            signed = {self.positions.get(address) for address in block['signatures']}
+            self.windows.add_block(block['height'], active, signed, proposer)
+
+    def flush(self):
+        active_counts = Counter()
+        for active, blocks in self.active_blocks.items():
+            for position in active:
+                active_counts[position] += blocks
+
+        deltas = {}
+        for position, blocks in active_counts.items():
+            validator = self.validators[position]
+            signed = self.signed[position]
+            proposed = self.proposed[position]
+            validator['total_signed_blocks'] += signed
+            validator['total_missed_blocks'] += blocks - signed
+            validator['total_proposed_blocks'] += proposed
+            deltas[validator['hex']] = [signed, blocks - signed, proposed]
+
+        if self.windows is not None:
+            self.windows.export()
+        self.reset()
+        return deltas
@@ -0,0 +1,40 @@
+import asyncio
+from collections import OrderedDict
+
+class ValsetCache:
+
+    def __init__(self, max_size=64):
+        self.max_size = max_size
+        self.valsets = OrderedDict()
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, validators_hash, fetch):
+        if not validators_hash:
+            return await fetch()
+
+        valset = self.valsets.get(validators_hash)
+        if valset is not None:
+            self.valsets.move_to_end(validators_hash)
+            self.hits += 1
+            return valset
+
+        # Heights of the same set are fetched concurrently, only the first one goes to the node
+        task = self.pending.get(validators_hash)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(fetch())
+            self.pending[validators_hash] = task
+            task.add_done_callback(lambda _: self.pending.pop(validators_hash, None))
+
+        valset = await asyncio.shield(task)
+        if valset is not None:
+            self.put(validators_hash, valset)
+        return valset
+
+    def put(self, validators_hash, valset):
+        self.valsets[validators_hash] = valset
+        self.valsets.move_to_end(validators_hash)
+        while len(self.valsets) > self.max_size:
+            self.valsets.popitem(last=False)
@@ -0,0 +1,155 @@
+import base64
+from collections import deque
+
+WINDOW_FIELDS = (
+    'window_blocks', 'window_missed_blocks', 'missed_blocks_streak', 'longest_missed_blocks_streak', 'window_proposed_blocks',
+    'window_proposed_heights', 'window_offset', 'window_bits', 'leading_missed_blocks'
+)
+
+class SigningWindows:
+
+    def __init__(self, validators, window=10000, proposals_window=1000, leading=False):
+        self.validators = validators
+        self.window = window
+        self.proposals_window = proposals_window
+        # Backfill shards also count the misses before their first signed block, streaks are joined across shard borders
+        self.leading = [] if leading else None
+        self.bits = []
+        self.offsets = []
+        self.missed = []
+        self.streaks = []
+        self.longest = []
+        self.proposed = []
+        self.proposals = deque()
+        self.register()
+
+        proposals = []
+        for position, validator in enumerate(self.validators):
+            for height in validator.get('window_proposed_heights') or []:
+                proposals.append((height, position))
+                self.proposed[position] += 1
+        self.proposals.extend(sorted(proposals))
+
+    def register(self):
+        for position in range(len(self.bits), len(self.validators)):
+            self.restore(self.validators[position])
+
+    def restore(self, validator):
+        # One bit per block the validator was in the set, a set bit is a missed block
+        size = (self.window + 7) // 8
+        bits = bytearray(base64.b64decode(validator['window_bits'])) if validator.get('window_bits') else None
+        if bits is None or len(bits) != size:
+            bits = bytearray(size)
+            offset, missed = 0, 0
+        else:
+            offset, missed = validator.get('window_offset', 0), validator.get('window_missed_blocks', 0)
+
+        self.bits.append(bits)
+        self.offsets.append(offset)
+        self.missed.append(missed)
+        self.streaks.append(validator.get('missed_blocks_streak', 0))
+        self.longest.append(validator.get('longest_missed_blocks_streak', 0))
+        self.proposed.append(0)
+        if self.leading is not None:
+            self.leading.append(validator.get('leading_missed_blocks', 0))
+
+    def add_block(self, height, active, signed, proposer):
+        if len(self.bits) != len(self.validators):
+            self.register()
+
+        window = self.window
+        for position in active:
+            offset = self.offsets[position]
+            index = offset % window
+            byte, bit = index >> 3, 1 << (index & 7)
+            bits = self.bits[position]
+            # The bit being overwritten is the block that just left the window
+            was_missed = bits[byte] & bit
+            if position in signed:
+                if was_missed:
+                    bits[byte] ^= bit
+                    self.missed[position] -= 1
+                self.streaks[position] = 0
+            else:
+                if not was_missed:
+                    bits[byte] |= bit
+                    self.missed[position] += 1
+                streak = self.streaks[position] + 1
+                self.streaks[position] = streak
+                if streak > self.longest[position]:
+                    self.longest[position] = streak
+                if self.leading is not None and streak == offset + 1:
+                    self.leading[position] = streak
+            self.offsets[position] = offset + 1
+
+        if proposer is not None:
+            self.proposals.append((height, proposer))
+            self.proposed[proposer] += 1
+        while self.proposals and self.proposals[0][0] <= height - self.proposals_window:
+            _, position = self.proposals.popleft()
+            self.proposed[position] -= 1
+
+    def export(self):
+        heights = {}
+        for height, position in self.proposals:
+            heights.setdefault(position, []).append(height)
+
+        for position in range(len(self.bits)):
+            validator = self.validators[position]
+            validator['window_blocks'] = min(self.offsets[position], self.window)
+            validator['window_missed_blocks'] = self.missed[position]
+            validator['missed_blocks_streak'] = self.streaks[position]
+            validator['longest_missed_blocks_streak'] = self.longest[position]
+            validator['window_proposed_blocks'] = self.proposed[position]
+            validator['window_proposed_heights'] = heights.get(position, [])
+            validator['window_offset'] = self.offsets[position]
+            validator['window_bits'] = base64.b64encode(self.bits[position]).decode()
+            if self.leading is not None:
+                validator['leading_missed_blocks'] = self.leading[position]
+
+def chronological(validator, window):
+    # The ring as an int with the oldest block of the window in the lowest bit
+    offset = validator.get('window_offset', 0)
+    count = min(offset, window)
+    if not count:
+        return 0, 0
+
+    bits = int.from_bytes(base64.b64decode(validator['window_bits']), 'little')
+    if offset > window:
+        start = offset % window
+        bits = (bits >> start) | (bits << (window - start))
+    return bits & ((1 << count) - 1), count
+
+def merge_windows(validator, shard_validator, window, proposals_window, end_height):
+    # Shards are merged in height order, a streak running into a shard continues with the misses it starts with
+    streak = validator.get('missed_blocks_streak', 0)
+    validator['longest_missed_blocks_streak'] = max(
+        validator.get('longest_missed_blocks_streak', 0),
+        shard_validator.get('longest_missed_blocks_streak', 0),
+        streak + shard_validator.get('leading_missed_blocks', 0)
+    )
+    if shard_validator.get('missed_blocks_streak', 0) == shard_validator.get('window_offset', 0):
+        validator['missed_blocks_streak'] = streak + shard_validator.get('window_offset', 0)
+    else:
+        validator['missed_blocks_streak'] = shard_validator['missed_blocks_streak']
+
+    bits, count = chronological(validator, window)
+    shard_bits, shard_count = chronological(shard_validator, window)
+    bits |= shard_bits << count
+    count += shard_count
+    if count > window:
+        bits >>= count - window
+        count = window
+
+    # Back to a ring where the block with offset n sits at bit n % window
+    offset = validator.get('window_offset', 0) + shard_validator.get('window_offset', 0)
+    rotation = (offset - count) % window
+    ring = ((bits << rotation) | (bits >> (window - rotation))) & ((1 << window) - 1)
+    validator['window_offset'] = offset
+    validator['window_blocks'] = count
+    validator['window_missed_blocks'] = ring.bit_count()
+    validator['window_bits'] = base64.b64encode(ring.to_bytes((window + 7) // 8, 'little')).decode()
+
+    heights = (validator.get('window_proposed_heights') or []) + (shard_validator.get('window_proposed_heights') or [])
+    validator['window_proposed_heights'] = [height for height in heights if height > end_height - 1 - proposals_window]
+    validator['window_proposed_blocks'] = len(validator['window_proposed_heights'])